@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pygame
+
+# 各个方向相对于朝上的图片需要旋转的角度
+ROTATIONS = {"UP": 0, "LEFT": 90, "DOWN": 180, "RIGHT": 270}
+
+
+class Asset:
+    """
+    一张缩放好的图片，以及它朝四个方向的预旋转版本和对应的碰撞遮罩，所有使用这张图片的物体共享这些Surface和Mask
+    """
+
+    def __init__(self, image):
+        """
+        :param image: 朝上的图片
+        """
+        self.images = {}
+        self.masks = {}
+        self.setImage(image)
+
+    def setImage(self, image):
+        """
+        设置朝上的图片并重新生成四个方向的版本及碰撞遮罩
+
+        :param image: 朝上的图片
+        """
+        for direction, angle in ROTATIONS.items():
+            self.images[direction] = pygame.transform.rotate(image, angle) if angle else image
+            self.masks[direction] = pygame.mask.from_surface(self.images[direction])
+
+
+class AssetCache:
+    """
+    进程内共享的图片缓存，以(路径, 尺寸, 初始旋转角度)为键，每张图片只加载、缩放、convert一次。
+    统计命中次数、未命中次数和加载耗时。后台线程预取下一关时也会调用get，所以缓存的读写都在锁里
+    """
+
+    def __init__(self):
+        self.assets = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loadTime = 0.0
+
+    def get(self, path: str, size=(50, 50), rotation=0):
+        """
+        获取图片，没有缓存时加载
+
+        :param path: 图片路径
+        :param size: 缩放后的尺寸
+        :param rotation: 加载后先旋转的角度，用于图片本身不是朝上的情况
+        :return: Asset对象
+        """
+        key = (path, tuple(size), rotation)
+        with self.lock:
+            asset = self.assets.get(key)
+            if asset is not None:
+                self.hits += 1
+                return asset
+            self.misses += 1
+            start = time.perf_counter()
+            image = convert(pygame.transform.scale(pygame.image.load(path), size))
+            if rotation:
+                image = pygame.transform.rotate(image, rotation)
+            asset = Asset(image)
+            self.assets[key] = asset
+            self.loadTime += time.perf_counter() - start
+            return asset
+
+    def convertAll(self):
+        """
+        打开窗口之后调用，把窗口打开之前加载的图片转换成和屏幕一致的像素格式。
+        已经引用旧Surface的物体需要重新turn一次才会用上新的Surface。
+        开始转换之后后台线程新加载的图片不在这一轮里，它们在get里已经按当前的窗口转换过
+        """
+        with self.lock:
+            cached = list(self.assets.values())
+        for asset in cached:
+            asset.setImage(convert(asset.images["UP"]))
+
+    def report(self):
+        """
+        :return: 缓存统计信息的字符串
+        """
+        return "Asset cache: {} images, {} hits, {} misses, {:.1f} ms loading." \
+            .format(len(self.assets), self.hits, self.misses, self.loadTime * 1000)
+
+
+def convert(image):
+    """
+    如果已经打开了窗口，把图片转换成和屏幕一致的像素格式，带透明通道的图片保留透明通道
+
+    :param image: Surface对象
+    :return: 转换后的Surface对象
+    """
+    if pygame.display.get_surface() is None:
+        return image
+    if image.get_flags() & pygame.SRCALPHA:
+        return image.convert_alpha()
+    return image.convert()
+
+
+# 全局共享的缓存
+assets = AssetCache()
@@ -0,0 +1,69 @@
+import pygame
+
+# 世界按块划分，每块CHUNK_CELLS * CHUNK_CELLS个格子，渲染的背景缓存和模拟的精细程度都以块为单位
+CHUNK_CELLS = 8
+CHUNK_SIZE = CHUNK_CELLS * 50
+# 窗口的最大尺寸，地图比它小时窗口和地图一样大
+VIEWPORT = (1000, 750)
+
+
+def chunkOf(x: int, y: int):
+    """
+    :param x: 像素横坐标
+    :param y: 像素纵坐标
+    :return: 所在块的坐标
+    """
+    return x // CHUNK_SIZE, y // CHUNK_SIZE
+
+
+def chunkDistance(a: tuple, b: tuple):
+    """
+    :return: 两个块之间的切比雪夫距离
+    """
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+class Camera:
+    """
+    跟随玩家坦克滚动的摄像机，决定窗口里显示的是地图的哪一部分，不会移出地图的边界
+    """
+
+    def __init__(self, gameMap, size: tuple):
+        """
+        :param gameMap: GameMap对象
+        :param size: 窗口大小，超过地图大小的部分会被截掉
+        """
+        self.gameMap = gameMap
+        self.width = min(size[0], gameMap.width)
+        self.height = min(size[1], gameMap.height)
+        self.left = 0
+        self.top = 0
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def rect(self):
+        """
+        :return: 窗口在世界坐标里对应的矩形
+        """
+        return pygame.Rect(self.left, self.top, self.width, self.height)
+
+    def follow(self, sprite):
+        """
+        把摄像机移到以精灵为中心的位置
+
+        :param sprite: 要跟随的精灵
+        """
+        x, y = sprite.rect.center
+        self.left = max(0, min(x - self.width // 2, self.gameMap.width - self.width))
+        self.top = max(0, min(y - self.height // 2, self.gameMap.height - self.height))
+
+    def visibleChunks(self):
+        """
+        :return: 和窗口有重叠的所有块的坐标
+        """
+        left, top = chunkOf(self.left, self.top)
+        right, bottom = chunkOf(self.left + self.width - 1, self.top + self.height - 1)
+        return [(x, y) for y in range(top, bottom + 1) for x in range(left, right + 1)]
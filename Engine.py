@@ -0,0 +1,345 @@
+import random
+import time
+from collections import namedtuple
+
+from Camera import chunkOf, chunkDistance
+from Events import events, VERBOSITY_NAMES
+from GameMap import GameMap
+from Layers import canCollide
+from Profiler import profiler
+from Replay import Replay, ReplayMismatch, SPAWN, stateHash
+from Scheduler import TickScheduler, AIScheduler
+import Snapshot
+from SpatialHash import collide
+from Tiles import Tile
+
+# 一局游戏的结果
+WIN = "win"
+LOSE = "lose"
+TIMEOUT = "timeout"
+
+SimulationResult = namedtuple("SimulationResult",
+                              ["map", "seed", "enemyConfig", "outcome", "ticks", "damageDealt", "damageTaken", "ticksPerSecond"])
+
+
+class Simulation:
+    """
+    一局游戏的模拟，负责敌方坦克的AI、按固定步长推进移动、碰撞检测以及胜负判断，不涉及任何绘图和事件处理。
+    窗口模式的gameLoop和无窗口模式的runHeadless都通过它来推进游戏。
+    """
+
+    def __init__(self, mapPath: str, seed=None, tickRate=60, autoSpawn=False, enemyConfig=None, lodRadius=None,
+                 aiMaxDecisions=None, aiLodTicks=0):
+        """
+        读取地图并初始化调度器
+
+        :param mapPath: 地图路径
+        :param enemyConfig: 所有敌方坦克统一使用的配置简称，None为按地图原样
+        :param seed: 随机数种子，None表示随机选一个，选中的种子记在seed属性里
+        :param tickRate: 每秒的tick数
+        :param autoSpawn: 是否每秒按tick自动放出一辆敌方坦克，窗口模式下由USEREVENT定时器负责
+        :param lodRadius: 和玩家坦克所在的块的距离超过这么多块的敌方坦克以低精度模拟，None为全部以完整精度模拟
+        :param aiMaxDecisions: 每个tick最多做决定的敌方坦克数，None为不限制
+        :param aiLodTicks: 远处的敌方坦克每远一块，做决定的间隔多这么多tick，0为不按距离降低频率
+        """
+        self.mapPath = mapPath
+        self.enemyConfig = enemyConfig
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.map = GameMap(mapPath, enemyConfig)
+        self.map.random.seed(seed)
+        self.scheduler = TickScheduler(self.map, tickRate)
+        self.ai = AIScheduler(self.map, aiMaxDecisions, lodTicks=aiLodTicks)
+        self.player = self.map.groups["FriendlyTank"].sprites()[0]
+        self.autoSpawn = autoSpawn
+        self.lodRadius = lodRadius
+        self.spawnIndex = 0
+        self.outcome = None
+        # 正在录制的录像，None为不录制
+        self.replay = None
+
+    def startRecording(self):
+        """
+        开始录制，需要在第一个tick之前调用
+
+        :return: Replay对象，之后的输入和每个tick的状态哈希都会记在里面
+        """
+        self.replay = Replay(self.mapPath, self.seed, self.scheduler.tickRate, self.autoSpawn, self.enemyConfig,
+                             self.lodRadius, self.ai.maxDecisions, self.ai.lodTicks)
+        return self.replay
+
+    def snapshot(self):
+        """
+        :return: 当前模拟状态的二进制快照，见Snapshot.capture
+        """
+        return Snapshot.capture(self)
+
+    def restore(self, blob: bytes):
+        """
+        恢复到一个快照，快照可以来自这一局，也可以来自同一张地图的另一局。正在录制的录像不会跟着回退
+
+        :param blob: snapshot的返回值
+        """
+        Snapshot.restore(self, blob)
+
+    def spawnNext(self):
+        """
+        放出下一辆还没出现的敌方坦克
+        """
+        m = self.map
+        # with autoSpawn the spawns come from step and are not inputs
+        if self.replay is not None and not self.autoSpawn:
+            self.replay.record(self.scheduler.ticks, SPAWN)
+        if self.spawnIndex < len(m.groups["InvisibleEnemyTank"]):
+            tank = m.groups["InvisibleEnemyTank"].sprites()[self.spawnIndex]
+            tank.invisible = False
+            m.groups["EnemyTank"].add(tank)
+            m.itemSpawned(tank)
+            self.spawnIndex += 1
+
+    def applyAction(self, action, tank=None):
+        """
+        对玩家坦克（或者给出的另一辆友方坦克）执行一个动作
+
+        :param action: "UP"、"DOWN"、"LEFT"、"RIGHT"表示移动一格，"FIRE"表示开火，None表示什么都不做
+        :param tank: 执行动作的友方坦克，None为玩家坦克，只有玩家坦克的动作会录进录像
+        """
+        if action is None:
+            return
+        if tank is None:
+            tank = self.player
+        if self.replay is not None and tank is self.player:
+            self.replay.record(self.scheduler.ticks, action)
+        if action == "FIRE":
+            tank.fire(self.map)
+        else:
+            tank.move(action, tank.speed, 50)  # 10 speed, 50 pixels
+
+    def step(self):
+        """
+        推进一个tick：敌方坦克的AI、移动动画和冷却、碰撞检测，最后判断胜负
+
+        :return: 胜负结果，还没结束时为None
+        """
+        m = self.map
+        events.tick = self.scheduler.ticks
+        if self.autoSpawn and self.scheduler.ticks % self.scheduler.tickRate == 0:
+            self.spawnNext()
+        if self.lodRadius is not None:
+            self.updateFidelity()
+
+        self.ai.run(self.scheduler.ticks, self.player)
+        if profiler.enabled:
+            profiler.lap("ai")
+
+        self.scheduler.tick()
+        if profiler.enabled:
+            profiler.lap("move")
+        self.collide()
+        if profiler.enabled:
+            profiler.lap("collide")
+        self.outcome = self.checkOutcome()
+        if self.replay is not None:
+            self.replay.hashes.append(stateHash(self))
+        return self.outcome
+
+    def updateFidelity(self):
+        """
+        按和玩家坦克的距离决定每辆敌方坦克这个tick用完整精度还是低精度模拟
+        """
+        center = chunkOf(*self.player.rect.center)
+        for tank in self.map.groups["EnemyTank"]:
+            tank.lowFidelity = chunkDistance(chunkOf(*tank.rect.center), center) > self.lodRadius
+
+    def advance(self, elapsedMs: float):
+        """
+        窗口模式下使用，按经过的真实时间推进对应数量的tick
+
+        :param elapsedMs: 距离上次调用经过的毫秒数
+        :return: 本次推进的tick数
+        """
+        return self.scheduler.advance(elapsedMs, self.step)
+
+    def collide(self):
+        """
+        碰撞检测，只检测会动的物体，粗筛用空间哈希和图块层，再按碰撞层过滤掉不会发生作用的物体对，
+        精确检测先比较rect再用缓存的mask，导弹由导弹池统一检测
+        """
+        m = self.map
+        for key in TickScheduler.MOVING_GROUPS:
+            if key not in m.groups:
+                continue
+            for tank in m.groups[key].sprites():
+                m.spatialHash.update(tank)
+                if tank.lowFidelity:
+                    self.collideCell(tank)
+                    continue
+                # only the sprites in the same or neighbouring cells are candidates
+                for item in m.spatialHash.query(tank):
+                    if canCollide(tank, item) and collide(item, tank):
+                        tank.attack(item)
+                # walls are tiles, only the ones under the sprite are candidates
+                tiles = m.tiles.candidates(tank)
+                m.spatialHash.pairsTested += len(tiles)
+                for tile in tiles:
+                    if canCollide(tank, tile) and collide(tile, tank):
+                        tank.attack(tile)
+        m.missiles.collide()
+        m.spatialHash.nextFrame()
+
+    def collideCell(self, tank):
+        """
+        低精度的碰撞检测，不比较mask，只让坦克攻击它所在格子上的图块和静态物体（基地）
+
+        :param tank: 低精度模拟的坦克
+        """
+        m = self.map
+        x, y = tank.rect.centerx // 50, tank.rect.centery // 50
+        if not m.occupancy.inBounds(x, y):
+            return
+        if m.tiles.isTile(x, y):
+            tank.attack(Tile(m.tiles, x, y))
+        else:
+            item = m.occupancy.entityAt(x, y)
+            if item is not None:
+                tank.attack(item)
+
+    def checkOutcome(self):
+        """
+        判断胜负，玩家坦克被摧毁或者基地被摧毁即失败，所有敌方坦克被消灭即胜利
+
+        :return: WIN、LOSE或None
+        """
+        m = self.map
+        if self.player.hp == 0 or len(m.groups["Base"]) == 0:
+            return LOSE
+        elif len(m.groups["InvisibleEnemyTank"]) == 0:
+            return WIN
+        return None
+
+
+def idlePolicy(simulation: Simulation):
+    """
+    什么都不做的策略
+    """
+    return None
+
+
+class ScriptedPolicy:
+    """
+    脚本策略，按给定的tick执行给定的动作
+    """
+
+    def __init__(self, actions):
+        """
+        :param actions: (tick, action)的列表，或者tick到action的字典
+        """
+        self.actions = dict(actions)
+
+    def __call__(self, simulation: Simulation):
+        return self.actions.get(simulation.scheduler.ticks)
+
+
+def huntPolicy(simulation: Simulation):
+    """
+    简单的AI策略：和最近的可见敌方坦克在同一行或同一列时朝它开火，否则朝它移动
+
+    :param simulation: Simulation对象
+    :return: 动作
+    """
+    player = simulation.player
+    if player.moving:
+        return None
+    enemies = simulation.map.groups["EnemyTank"].sprites()
+    if not enemies:
+        return None
+    px, py = player.rect.left // 50, player.rect.top // 50
+    target = min(enemies, key=lambda e: abs(e.rect.left // 50 - px) + abs(e.rect.top // 50 - py))
+    dx, dy = target.rect.left // 50 - px, target.rect.top // 50 - py
+    if dx == 0 or dy == 0:
+        if dx == 0:
+            direction = "UP" if dy < 0 else "DOWN"
+        else:
+            direction = "LEFT" if dx < 0 else "RIGHT"
+        if player.direction == direction:
+            return "FIRE"
+        return direction
+    if abs(dx) >= abs(dy):
+        return "LEFT" if dx < 0 else "RIGHT"
+    return "UP" if dy < 0 else "DOWN"
+
+
+def runHeadless(mapPath: str, policy=huntPolicy, seed=0, tickLimit=60 * 60 * 5, timeLimit=None, enemyConfig=None):
+    """
+    不打开窗口、不限帧率地跑完一局游戏，用于回归测试和数值平衡
+
+    :param mapPath: 地图路径
+    :param policy: 玩家坦克的策略，每个tick以Simulation对象为参数调用一次，返回一个动作
+    :param seed: 随机数种子
+    :param tickLimit: 最多模拟的tick数，超过即判为超时
+    :param timeLimit: 最多运行的真实秒数，None为不限制，超过即判为超时
+    :param enemyConfig: 所有敌方坦克统一使用的配置简称，None为按地图原样
+    :return: SimulationResult对象
+    """
+    simulation = Simulation(mapPath, seed=seed, autoSpawn=True, enemyConfig=enemyConfig)
+    start = time.perf_counter()
+    outcome = None
+    while outcome is None and simulation.scheduler.ticks < tickLimit:
+        simulation.applyAction(policy(simulation))
+        outcome = simulation.step()
+        if timeLimit is not None and time.perf_counter() - start > timeLimit:
+            break
+    elapsed = time.perf_counter() - start
+    ticks = simulation.scheduler.ticks
+    return SimulationResult(map=mapPath, seed=seed, enemyConfig=enemyConfig, outcome=outcome or TIMEOUT, ticks=ticks,
+                            damageDealt=simulation.map.damageDealt, damageTaken=simulation.map.damageTaken,
+                            ticksPerSecond=ticks / elapsed if elapsed > 0 else 0.0)
+
+
+def runReplay(replay: Replay, check=True):
+    """
+    不打开窗口、不限帧率地重放一段录像，按录制时的tick给出同样的输入
+
+    :param replay: Replay对象
+    :param check: 是否逐tick比较状态哈希
+    :return: SimulationResult对象
+    :raises ReplayMismatch: 某个tick的状态哈希和录像里的不一致
+    """
+    simulation = Simulation(replay.mapPath, seed=replay.seed, tickRate=replay.tickRate, autoSpawn=replay.autoSpawn,
+                            enemyConfig=replay.enemyConfig, lodRadius=replay.lodRadius,
+                            aiMaxDecisions=replay.aiMaxDecisions, aiLodTicks=replay.aiLodTicks)
+    inputs = replay.inputsByTick()
+    start = time.perf_counter()
+    for tick in range(replay.ticks):
+        for action in inputs.get(tick, ()):
+            if action == SPAWN:
+                simulation.spawnNext()
+            else:
+                simulation.applyAction(action)
+        simulation.step()
+        if check:
+            actual = stateHash(simulation)
+            if actual != replay.hashes[tick]:
+                raise ReplayMismatch(tick, replay.hashes[tick], actual)
+    elapsed = time.perf_counter() - start
+    return SimulationResult(map=replay.mapPath, seed=replay.seed, enemyConfig=replay.enemyConfig,
+                            outcome=simulation.outcome or TIMEOUT, ticks=replay.ticks,
+                            damageDealt=simulation.map.damageDealt, damageTaken=simulation.map.damageTaken,
+                            ticksPerSecond=replay.ticks / elapsed if elapsed > 0 else 0.0)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="无窗口、不限帧率地模拟一局游戏")
+    parser.add_argument("map", help="地图路径")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--ticks", type=int, default=60 * 60 * 5, help="最多模拟的tick数")
+    parser.add_argument("--policy", choices=["hunt", "idle"], default="hunt", help="玩家坦克的策略")
+    parser.add_argument("--log", help="事件日志的路径，\"-\"为以文字形式输出到控制台，不给出时不记录事件")
+    parser.add_argument("--verbosity", choices=VERBOSITY_NAMES, default="combat", help="记录哪些事件")
+    args = parser.parse_args()
+    if args.log is not None:
+        events.configure(VERBOSITY_NAMES.index(args.verbosity), args.log)
+    print(runHeadless(args.map, huntPolicy if args.policy == "hunt" else idlePolicy, args.seed, args.ticks))
@@ -0,0 +1,245 @@
+import atexit
+import sys
+import threading
+
+import numpy as np
+
+# 事件类型
+MOVE = 0
+FIRE = 1
+HIT = 2
+KILL = 3
+SPAWN = 4
+EVENT_NAMES = ("move", "fire", "hit", "kill", "spawn")
+
+# 详细程度，每一级包含前一级的所有事件
+QUIET = 0
+KILLS = 1
+COMBAT = 2
+ALL = 3
+VERBOSITY_NAMES = ("quiet", "kills", "combat", "all")
+# 每种事件需要的最低详细程度
+EVENT_VERBOSITY = {MOVE: ALL, FIRE: COMBAT, HIT: COMBAT, KILL: KILLS, SPAWN: KILLS}
+
+# 事件涉及的对象的种类
+NONE = 0
+ENTITY = 1
+TILE = 2
+MISSILE = 3
+
+DIRECTION_CODES = {"UP": 0, "DOWN": 1, "LEFT": 2, "RIGHT": 3}
+
+# 日志文件：文件头之后是定长的二进制记录
+LOG_MAGIC = b"TKEV\x01\x00\x00\x00"
+RECORD = np.dtype([("tick", "<u4"), ("kind", "u1"), ("subjectKind", "u1"), ("otherKind", "u1"), ("pad", "u1"),
+                   ("subject", "<i4"), ("other", "<i4"), ("a", "<i4"), ("b", "<i4")])
+
+
+def refOf(obj):
+    """
+    把事件涉及的对象编码成(种类, 编号)：精灵用实体编号，图块用(x << 16) | y，导弹用槽位编号
+
+    :param obj: 精灵、Tile对象、导弹的槽位编号或者None
+    """
+    if obj is None:
+        return NONE, 0
+    if isinstance(obj, (int, np.integer)):
+        return MISSILE, int(obj)
+    if obj.entityId:
+        return ENTITY, obj.entityId
+    return TILE, obj.x << 16 | obj.y
+
+
+def describe(record):
+    """
+    :param record: 一条事件记录
+    :return: 可读的一行文字
+    """
+    tick, kind, subjectKind, otherKind, _, subject, other, a, b = record
+    names = {NONE: "-", ENTITY: "entity {}", TILE: "tile {}", MISSILE: "missile {}"}
+
+    def name(refKind, value):
+        if refKind == TILE:
+            return "tile ({}, {})".format(value >> 16, value & 0xFFFF)
+        return names[refKind].format(value)
+
+    return "{:>8} {:<6}{:<16}{:<16}{} {}".format(tick, EVENT_NAMES[kind], name(subjectKind, subject),
+                                                name(otherKind, other), a, b)
+
+
+class EventBus:
+    """
+    缓冲的结构化事件日志，取代热路径上的print。
+    事件以定长的元组记录在内存里的环形缓冲区中，后台线程定期把一批事件写进紧凑的二进制文件（或者以文字形式写到控制台），
+    游戏线程从不等待I/O；写入跟不上时覆盖最旧的事件并计数。
+    调用方先检查enabled[事件类型]再调用emit，关闭时只有一次列表下标的开销，不会格式化任何东西
+    """
+
+    def __init__(self, capacity=65536):
+        """
+        :param capacity: 环形缓冲区的容量（事件数）
+        """
+        self.capacity = capacity
+        self.ring = [None] * capacity
+        # 已经写入和已经取走的事件总数，ring[head % capacity]是下一个写入的位置
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        # 当前的tick，由Simulation每个tick设置
+        self.tick = 0
+        self.verbosity = QUIET
+        self.enabled = [False] * len(EVENT_NAMES)
+        self.file = None
+        self.text = False
+        self.flushInterval = 0.2
+        self.writer = None
+        self.wakeup = threading.Event()
+        self.stopping = False
+
+    def configure(self, verbosity=QUIET, path=None, flushInterval=0.2):
+        """
+        设置详细程度和输出位置，之前的输出会先写完并关闭
+
+        :param verbosity: 详细程度，QUIET为关闭
+        :param path: 日志文件路径，"-"为以文字形式写到标准输出，None为只保留在内存的环形缓冲区里
+        :param flushInterval: 后台线程写入的间隔秒数
+        """
+        self.close()
+        self.verbosity = verbosity
+        self.enabled = [verbosity >= EVENT_VERBOSITY[kind] for kind in range(len(EVENT_NAMES))]
+        self.flushInterval = flushInterval
+        self.head = self.tail = self.dropped = 0
+        if verbosity == QUIET or path is None:
+            return
+        if path == "-":
+            self.file, self.text = sys.stdout, True
+        else:
+            self.file, self.text = open(path, "wb"), False
+            self.file.write(LOG_MAGIC)
+        self.stopping = False
+        self.writer = threading.Thread(target=self.writeLoop, name="EventWriter", daemon=True)
+        self.writer.start()
+
+    def emit(self, kind: int, subject, other=None, a=0, b=0):
+        """
+        记录一个事件
+
+        :param kind: 事件类型
+        :param subject: 事件的主体
+        :param other: 事件涉及的另一个对象
+        :param a: 附加数据，含义见各个调用方
+        :param b: 附加数据
+        """
+        subjectKind, subjectId = refOf(subject)
+        otherKind, otherId = refOf(other)
+        with self.lock:
+            self.ring[self.head % self.capacity] = (self.tick, kind, subjectKind, otherKind, 0,
+                                                    subjectId, otherId, int(a), int(b))
+            self.head += 1
+        if self.writer is not None and self.head - self.tail >= self.capacity // 2:
+            self.wakeup.set()
+
+    def drain(self):
+        """
+        取走缓冲区里所有还没取走的事件
+
+        :return: 事件记录的列表，按发生顺序
+        """
+        with self.lock:
+            head = self.head
+            if head - self.tail > self.capacity:
+                self.dropped += head - self.tail - self.capacity
+                self.tail = head - self.capacity
+            start, end = self.tail % self.capacity, head % self.capacity
+            if head == self.tail:
+                batch = []
+            elif start < end:
+                batch = self.ring[start:end]
+            else:
+                batch = self.ring[start:] + self.ring[:end]
+            self.tail = head
+        return batch
+
+    def recent(self, n=None):
+        """
+        只读地查看缓冲区里最近的事件，不影响写入
+
+        :param n: 事件数，None为缓冲区里全部的
+        :return: 事件记录的列表
+        """
+        with self.lock:
+            count = min(self.head, self.capacity if n is None else min(n, self.capacity))
+            return [self.ring[i % self.capacity] for i in range(self.head - count, self.head)]
+
+    def write(self, batch):
+        """
+        把一批事件写到输出
+        """
+        if not batch or self.file is None:
+            return
+        if self.text:
+            self.file.write("".join(describe(r) + "\n" for r in batch))
+        else:
+            self.file.write(np.array(batch, RECORD).tobytes())
+        self.file.flush()
+
+    def writeLoop(self):
+        """
+        后台写入线程
+        """
+        while not self.stopping:
+            self.wakeup.wait(self.flushInterval)
+            self.wakeup.clear()
+            self.write(self.drain())
+
+    def flush(self):
+        """
+        在调用线程里立即把缓冲区里的事件写出去
+        """
+        self.write(self.drain())
+
+    def close(self):
+        """
+        停止后台线程，写完剩下的事件并关闭日志文件
+        """
+        if self.writer is not None:
+            self.stopping = True
+            self.wakeup.set()
+            self.writer.join()
+            self.writer = None
+        self.flush()
+        if self.file is not None and not self.text:
+            self.file.close()
+        self.file = None
+
+
+def readLog(path: str):
+    """
+    读取二进制日志文件
+
+    :param path: 日志文件路径
+    :return: RECORD类型的NumPy结构数组
+    """
+    with open(path, "rb") as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError("{} is not an event log".format(path))
+        return np.frombuffer(f.read(), RECORD)
+
+
+# 全局的事件总线，默认关闭
+events = EventBus()
+atexit.register(events.close)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="以文字形式显示二进制事件日志")
+    parser.add_argument("log", help="日志文件路径")
+    parser.add_argument("--kind", choices=EVENT_NAMES, nargs="*", help="只显示这些类型的事件")
+    args = parser.parse_args()
+    records = readLog(args.log)
+    if args.kind:
+        records = records[np.isin(records["kind"], [EVENT_NAMES.index(k) for k in args.kind])]
+    for record in records:
+        print(describe(record.tolist()))
@@ -1,6 +1,17 @@
 from Tanks import FriendlyTank, EnemyTank
-from Items import Missal, Wall, MetalWall, Base
+from Items import Base
+from Missiles import MissileSystem
+from Events import events, SPAWN
+from SpatialHash import SpatialHash
+from Navigation import Navigator, LineOfSight
+from MapLoader import loadLevel
+from Occupancy import OccupancyGrid, WALL, METAL_WALL, BASE
+from Tiles import TileLayer, TILE_KINDS
 import pygame
+import random
+
+# 地图头部的种类名对应的类，EnemyTank和图块单独处理
+ITEM_CLASSES = {"Base": Base, "FriendlyTank": FriendlyTank}
 
 
 class GameMap:
@@ -8,70 +19,163 @@ class GameMap:
     地图类，定义了游戏地图，初始化精灵等
     """
 
-    def __init__(self, configPath: str):
+    def __init__(self, configPath: str, enemyConfig=None):
         """
-        从文件中读取游戏地图，把静态的地图储存在realMap变量中，把所有的精灵组以字典形式储存在groups里面，statics为物品数量，以及地图的长和宽
+        从文件中读取游戏地图，把地图的占用情况储存在occupancy网格中，把所有的精灵组以字典形式储存在groups里面，statics为物品数量，以及地图的长和宽
 
         :param configPath: 配置文件路径
+        :param enemyConfig: 地图头部里某一种敌方坦克的简称，给定时所有敌方坦克都使用这一种的配置，None为按地图原样
         """
         super().__init__()
-        self.realMap = []
+        self.occupancy = None
         self.groups = {}
         self.statics = {}
         self.width = 0
         self.height = 0
+        # 碰撞检测的粗筛阶段使用的空间哈希，格子大小与地图方格一致
+        self.spatialHash = SpatialHash(50)
+        # 每局游戏独立的随机数生成器，方便固定种子复现
+        self.random = random.Random()
+        # 玩家一方造成的伤害和受到的伤害
+        self.damageDealt = 0
+        self.damageTaken = 0
+        # 所有敌方坦克共享的寻路距离场
+        self.navigator = Navigator(self)
+        # 敌方坦克判断开火能不能打到目标用的视线索引
+        self.sight = LineOfSight(self)
+        # 被打坏或摧毁的静态物体所在的格子，渲染器据此重新烘焙背景
+        self.dirtyCells = set()
+
+        level = loadLevel(configPath)
+        enemyOverride = None
+        if enemyConfig is not None:
+            for kind, config in level.entries:
+                if kind == "EnemyTank" and config["name"] == enemyConfig:
+                    enemyOverride = config
+            if enemyOverride is None:
+                raise ValueError("Map <{}> has no enemy config named {}".format(configPath, enemyConfig))
+        for kind, config in level.entries:
+            if kind not in self.groups:
+                self.groups[kind] = pygame.sprite.Group()
+                self.statics[kind] = 0
+        self.groups["InvisibleEnemyTank"] = pygame.sprite.Group()
+
+        self.occupancy = OccupancyGrid(level.width, level.height)
+        # 砖墙和金属墙存成图块，不创建精灵
+        self.tiles = TileLayer(self)
+        for kind, config in level.entries:
+            if kind in TILE_KINDS:
+                self.tiles.addType(kind, config["hp"], config["damage"])
+        for y in range(level.height):
+            for x in range(level.width):
+                code = level.codeAt(x, y)
+                if not code:
+                    continue
+                kind, config = level.entries[code - 1]
+                if kind in TILE_KINDS:
+                    self.tiles.setTile(x, y, kind)
+                    self.statics[kind] += 1
+                    continue
+                if kind == "EnemyTank":
+                    # 敌人坦克
+                    if enemyOverride is not None:
+                        config = enemyOverride
+                    item = EnemyTank(hp=config["hp"], damage=config["damage"], iconPath=config["image"],
+                                     initPosition=(x * 50, y * 50), movingSpeed=int(config["speed"]))
+                    self.groups["InvisibleEnemyTank"].add(item)
+                else:
+                    # 普通物品及自己的坦克
+                    item = ITEM_CLASSES[kind](hp=config["hp"], damage=config["damage"],
+                                              initPosition=(x * 50, y * 50), movingSpeed=int(config["speed"]))
+                    self.groups[kind].add(item)
+                self.statics[kind] += 1
+                self.occupancy.register(item)
+                if not item.invisible:
+                    self.occupancy.place(item)
+        level.close()
+
+        self.width = level.width * 50
+        self.height = level.height * 50
+        # 所有导弹都在这个对象池里，不是精灵
+        self.missiles = MissileSystem(self)
+        for group in self.groups.values():
+            for sprite in group:
+                sprite.setGameMap(self)
+                self.spatialHash.insert(sprite)
+        print("Map <{}> init success, has {} walls, {} metal walls and {} enemy tanks."
+              .format(configPath, self.statics["Wall"], self.statics["MetalWall"], self.statics["EnemyTank"]))
+
+    def refreshImages(self):
+        """
+        图片缓存转换过像素格式之后调用，让所有物体重新引用缓存里的Surface
+        """
+        for group in self.groups.values():
+            for sprite in group:
+                sprite.turn(sprite.direction)
+
+    def itemKilled(self, item):
+        """
+        物体被摧毁时由BaseItem或Tile的applyDamage方法调用，通知依赖地图状态的子系统
+
+        :param item: 被摧毁的物体
+        """
+        if item.cellType == WALL:
+            self.navigator.wallDestroyed((item.rect.left // 50, item.rect.top // 50))
+        if item.cellType in LineOfSight.BLOCKING:
+            self.sight.wallDestroyed((item.rect.left // 50, item.rect.top // 50))
+        self.itemDamaged(item)
+        self.occupancy.remove(item)
+
+    def itemDamaged(self, item):
+        """
+        物体受到伤害时由BaseItem或Tile的applyDamage方法调用，静态物体所在的格子需要重新烘焙
+
+        :param item: 受到伤害的物体
+        """
+        if item.cellType in (WALL, METAL_WALL, BASE):
+            self.dirtyCells.add((item.rect.left // 50, item.rect.top // 50))
+            self.occupancy.updateHp(item)
 
-        with open(configPath) as cf:
-            yMap = []
-            # 读取第一行的字典，获取名字和简称的对应关系
-            relationship = eval(cf.readline())
-            for key in relationship.keys():
-                self.groups[key] = pygame.sprite.Group()
-                self.statics[key] = 0
-            self.groups["InvisibleEnemyTank"] = pygame.sprite.Group()
-
-            y = 0
-            for line in cf.readlines().__iter__():
-                x = 0
-                elements = line.split(',')
-                tmp = []
-                for e in elements:
-                    e = e.strip()
-                    item = None
-                    for key in relationship.keys():
-                        if isinstance(relationship[key], list):
-                            # 敌人坦克
-                            for tanks in relationship[key]:
-                                if tanks["name"] == e:
-                                    item = eval(
-                                        "{}(hp={},damage={},iconPath='{}', initPosition=({}, {}), movingSpeed={})"
-                                            .format(key, tanks["hp"], tanks["damage"], tanks["image"], x * 50,
-                                                    y * 50, int(tanks["speed"])))
-                                    self.groups["InvisibleEnemyTank"].add(item)
-                                    self.statics[key] += 1
-                        # 普通物品及自己的坦克
-                        elif relationship[key]["name"] == e:
-                            item = eval("{}(hp={},damage={}, initPosition=({}, {}), movingSpeed={})"
-                                        .format(key, relationship[key]["hp"], relationship[key]["damage"], x * 50,
-                                                y * 50, int(relationship[key]["speed"])))
-                            self.groups[key].add(item)
-                            self.statics[key] += 1
-                    if key == "EnemyTank" and key == "FriendlyTank":
-                        item = None
-                    tmp.append(item)
-                    x += 1
-                y += 1
-                yMap.append(tmp)
-
-            # Convert yMap in xMap and store it in self.realMap
-            # Notice: this needs complete map
-            for x in range(len(yMap[0])):
-                tmp = []
-                for y in range(len(yMap)):
-                    tmp.append(yMap[y][x])
-                self.realMap.append(tmp)
-
-            self.width = len(self.realMap) * 50
-            self.height = len(self.realMap[0]) * 50
-            print("Map <{}> init success, has {} walls, {} metal walls and {} enemy tanks."
-                  .format(configPath, self.statics["Wall"], self.statics["MetalWall"], self.statics["EnemyTank"]))
+    def itemSpawned(self, item):
+        """
+        敌方坦克出现在地图上时调用，把它放到占用网格上
+
+        :param item: 出现的物体
+        """
+        self.occupancy.place(item)
+        if events.enabled[SPAWN]:
+            events.emit(SPAWN, item, None, item.rect.left // 50, item.rect.top // 50)
+
+    def itemMoved(self, item):
+        """
+        物体完成一次移动或者退回上一次的有效位置时由BaseItem调用，同步占用网格
+
+        :param item: 移动的物体
+        """
+        if item.entityId and item.alive():
+            self.occupancy.place(item)
+
+    def recordDamage(self, source, target, damage: int):
+        """
+        记录一次伤害，由BaseItem的applyDamage方法调用，导弹造成的伤害由MissileSystem算在发射它的坦克头上
+
+        :param source: 造成伤害的物体，可以为None
+        :param target: 受到伤害的物体
+        :param damage: 实际扣除的血量
+        """
+        if isinstance(source, FriendlyTank):
+            self.damageDealt += damage
+        if isinstance(target, (FriendlyTank, Base)):
+            self.damageTaken += damage
+
+
+def readHeader(configPath: str):
+    """
+    只读取地图的头部，获取名字和简称的对应关系
+
+    :param configPath: 配置文件路径
+    :return: 对应关系的字典
+    """
+    level = loadLevel(configPath)
+    level.close()
+    return level.header
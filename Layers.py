@@ -0,0 +1,36 @@
+# 阵营，各个物体类的team类属性取这些值。中立的物体（墙、基地）和所有物体都是敌对的
+TEAM_NONE = 0
+TEAM_PLAYER = 1
+TEAM_ENEMY = 2
+
+# 碰撞层，各个物体类的layer类属性取这些值，每一层占一位
+LAYER_STATIC = 1
+LAYER_TANK = 2
+LAYER_MISSILE = 4
+
+# 层 -> 会和它发生碰撞的层的位掩码，静态物体之间不会碰撞
+COLLIDES_WITH = {
+    LAYER_STATIC: LAYER_TANK | LAYER_MISSILE,
+    LAYER_TANK: LAYER_STATIC | LAYER_TANK | LAYER_MISSILE,
+    LAYER_MISSILE: LAYER_STATIC | LAYER_TANK | LAYER_MISSILE,
+}
+
+
+def canCollide(a, b):
+    """
+    在比较rect和mask之前过滤掉不可能发生作用的物体对：所在的层不会碰撞，或者有一方还没出现在地图上
+
+    :param a: 物体对象
+    :param b: 物体对象
+    :return: 是否需要做碰撞检测
+    """
+    return bool(COLLIDES_WITH[a.layer] & b.layer) and not a.invisible and not b.invisible
+
+
+def isHostile(teamA: int, teamB: int):
+    """
+    :param teamA: 一方的阵营
+    :param teamB: 另一方的阵营
+    :return: 两个阵营是否敌对，同一个阵营之间不会互相伤害
+    """
+    return teamA == TEAM_NONE or teamA != teamB
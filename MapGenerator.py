@@ -0,0 +1,82 @@
+import random
+
+# 生成的地图使用的头部，和level1.map的数值一致
+HEADER = ('{"Wall": {"name": "WW", "hp": 120, "damage": 5, "speed": 0}, '
+          '"MetalWall": {"name": "MM", "hp": -1, "damage": 1, "speed": 0}, '
+          '"Base": {"name": "BB", "hp": 1, "damage": 1000, "speed": 0}, '
+          '"FriendlyTank": {"name": "TT", "hp": 200, "damage": 55, "speed": 10}, '
+          '"EnemyTank": [{"name": "E1", "hp": 100, "damage": 29, "image": "./images/EnemyTank.png", "speed": 2}, '
+          '{"name": "E2", "hp": 120, "damage": 34, "image": "./images/EnemyTank2.png", "speed": 1}]}')
+EMPTY_CELL = "  "
+ENEMY_NAMES = ("E1", "E2")
+
+
+def generateMap(path: str, width: int, height=None, density=0.2, enemies=10, seed=0, metalRatio=0.2):
+    """
+    生成一张合法的地图并写入文件：四周是金属墙，基地在底部中间、三面围着砖墙，玩家坦克在基地左边两格，
+    内部的格子按density随机放砖墙和金属墙，敌方坦克从最上面的空格子开始往下随机摆放
+
+    :param path: 地图文件路径
+    :param width: 地图宽度（格子数），至少为7
+    :param height: 地图高度（格子数），None为和宽度相同
+    :param density: 内部格子是墙的概率
+    :param enemies: 敌方坦克的数量
+    :param seed: 随机数种子，同样的参数和种子生成同样的地图
+    :param metalRatio: 墙里面金属墙的比例
+    :return: 地图文件路径
+    """
+    if height is None:
+        height = width
+    if width < 7 or height < 5:
+        raise ValueError("map must be at least 7x5, got {}x{}".format(width, height))
+    rng = random.Random(seed)
+    grid = [[EMPTY_CELL] * width for _ in range(height)]
+    for y in range(height):
+        for x in range(width):
+            if x in (0, width - 1) or y in (0, height - 1):
+                grid[y][x] = "MM"
+
+    baseX, baseY = width // 2, height - 2
+    grid[baseY][baseX] = "BB"
+    for x, y in ((baseX - 1, baseY), (baseX + 1, baseY), (baseX, baseY - 1),
+                 (baseX - 1, baseY - 1), (baseX + 1, baseY - 1)):
+        grid[y][x] = "WW"
+    grid[baseY][baseX - 2] = "TT"
+    # keep the way out of the player's cell open
+    reserved = {(baseX - 2, baseY), (baseX - 2, baseY - 1), (baseX - 3, baseY)}
+
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            if grid[y][x] == EMPTY_CELL and (x, y) not in reserved and rng.random() < density:
+                grid[y][x] = "MM" if rng.random() < metalRatio else "WW"
+
+    placed = 0
+    for y in range(1, height - 1):
+        row = [x for x in range(1, width - 1) if grid[y][x] == EMPTY_CELL and (x, y) not in reserved]
+        for x in rng.sample(row, min(len(row), enemies - placed)):
+            grid[y][x] = rng.choice(ENEMY_NAMES)
+            placed += 1
+        if placed == enemies:
+            break
+    if placed < enemies:
+        raise ValueError("only {} free cells for {} enemy tanks".format(placed, enemies))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HEADER + "\n")
+        for row in grid:
+            f.write(",".join(row) + "\n")
+    return path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成指定大小、墙密度和敌人数量的地图")
+    parser.add_argument("path", help="地图文件路径")
+    parser.add_argument("--width", type=int, default=50, help="地图宽度（格子数）")
+    parser.add_argument("--height", type=int, help="地图高度（格子数），默认和宽度相同")
+    parser.add_argument("--density", type=float, default=0.2, help="内部格子是墙的概率")
+    parser.add_argument("--enemies", type=int, default=10, help="敌方坦克的数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args()
+    generateMap(args.path, args.width, args.height, args.density, args.enemies, args.seed)
@@ -0,0 +1,382 @@
+import ast
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+# 地图头部允许出现的物品种类，EnemyTank是列表，其余是字典
+KINDS = ("Wall", "MetalWall", "Base", "FriendlyTank", "EnemyTank")
+# 每种物品必须有的字段
+FIELDS = {"name": str, "hp": int, "damage": int, "speed": (int, float)}
+ENEMY_FIELDS = dict(FIELDS, image=str)
+
+# 编译后的二进制缓存格式
+CACHE_EXTENSION = ".mapc"
+CACHE_MAGIC = b"TKMC"
+CACHE_VERSION = 1
+# magic, version, source mtime_ns, source size, source sha1, width, height, entry count
+CACHE_HEADER = struct.Struct("<4sHqq20sIIH")
+# hp, damage, speed
+CACHE_ENTRY = struct.Struct("<iii")
+
+# 关卡索引文件，记录根目录下每张地图的大小和头部摘要，地图没变时不用再打开
+MAP_EXTENSION = ".map"
+INDEX_PATH = "levels.index"
+INDEX_VERSION = 1
+LevelInfo = namedtuple("LevelInfo", ["path", "width", "height", "digest"])
+
+
+class MapFormatError(ValueError):
+    """
+    地图文件格式错误，带有出错的行号和列号（都从1开始）
+    """
+
+    def __init__(self, path: str, line: int, column: int, message: str):
+        super().__init__("{}:{}:{}: {}".format(path, line, column, message))
+        self.path = path
+        self.line = line
+        self.column = column
+        self.message = message
+
+
+class Level:
+    """
+    解析好的关卡：物品种类表和类型码网格。类型码0为空地，n为entries[n - 1]
+    """
+
+    def __init__(self, entries, width: int, height: int, grid, mm=None):
+        """
+        :param entries: (种类, 配置字典)的列表，顺序和地图头部一致
+        :param width: 地图宽度（格子数）
+        :param height: 地图高度（格子数）
+        :param grid: 按行存储的类型码，长度为width * height
+        :param mm: 从缓存加载时对应的mmap对象
+        """
+        self.entries = entries
+        self.width = width
+        self.height = height
+        self.grid = grid
+        self.mm = mm
+
+    @property
+    def header(self):
+        """
+        :return: 和地图头部一样的字典，种类到配置（EnemyTank为配置列表）
+        """
+        header = {}
+        for kind, config in self.entries:
+            if kind == "EnemyTank":
+                header.setdefault(kind, []).append(config)
+            else:
+                header[kind] = config
+        return header
+
+    def codeAt(self, x: int, y: int):
+        """
+        :return: (x, y)格子的类型码
+        """
+        return self.grid[y * self.width + x]
+
+    def close(self):
+        """
+        释放mmap
+        """
+        if self.mm is not None:
+            self.grid.release()
+            self.mm.close()
+            self.mm = None
+
+
+def parseHeader(text: str, path: str):
+    """
+    解析地图第一行的字典，只接受字面量，不执行任何代码
+
+    :param text: 第一行的内容
+    :param path: 地图路径，用于报错
+    :return: (种类, 配置字典)的列表
+    """
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise MapFormatError(path, 1, e.offset or 1, "invalid header: {}".format(e.msg))
+    node = tree.body
+    if not isinstance(node, ast.Dict):
+        raise MapFormatError(path, 1, node.col_offset + 1, "header must be a dict")
+
+    entries = []
+    names = set()
+    for keyNode, valueNode in zip(node.keys, node.values):
+        kind = literal(keyNode, path)
+        if kind not in KINDS:
+            raise MapFormatError(path, 1, keyNode.col_offset + 1, "unknown item kind {!r}".format(kind))
+        if kind == "EnemyTank":
+            if not isinstance(valueNode, ast.List):
+                raise MapFormatError(path, 1, valueNode.col_offset + 1, "EnemyTank must be a list of dicts")
+            configs = [parseConfig(n, ENEMY_FIELDS, path) for n in valueNode.elts]
+        else:
+            configs = [parseConfig(valueNode, FIELDS, path)]
+        for config, configNode in zip(configs, valueNode.elts if kind == "EnemyTank" else [valueNode]):
+            if config["name"] in names:
+                raise MapFormatError(path, 1, configNode.col_offset + 1,
+                                     "duplicate item name {!r}".format(config["name"]))
+            names.add(config["name"])
+            entries.append((kind, config))
+    for kind in KINDS:
+        if kind not in [k for k, _ in entries]:
+            raise MapFormatError(path, 1, 1, "header has no {}".format(kind))
+    return entries
+
+
+def literal(node, path: str):
+    """
+    把语法树节点求值成字面量
+    """
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        raise MapFormatError(path, 1, node.col_offset + 1, "only literals are allowed in the header")
+
+
+def parseConfig(node, fields: dict, path: str):
+    """
+    解析并检查一种物品的配置字典
+
+    :param node: 字典的语法树节点
+    :param fields: 必须有的字段及其类型
+    :param path: 地图路径，用于报错
+    :return: 配置字典
+    """
+    if not isinstance(node, ast.Dict):
+        raise MapFormatError(path, 1, node.col_offset + 1, "item config must be a dict")
+    config = literal(node, path)
+    for field, fieldType in fields.items():
+        if field not in config:
+            raise MapFormatError(path, 1, node.col_offset + 1, "item config has no {!r}".format(field))
+        value = config[field]
+        if not isinstance(value, fieldType) or isinstance(value, bool):
+            column = node.values[[literal(k, path) for k in node.keys].index(field)].col_offset + 1
+            raise MapFormatError(path, 1, column, "{!r} has a wrong type".format(field))
+    if not config["name"] or "," in config["name"] or config["name"] != config["name"].strip():
+        raise MapFormatError(path, 1, node.col_offset + 1, "invalid item name {!r}".format(config["name"]))
+    return config
+
+
+def parseMap(text: str, path: str):
+    """
+    解析整个地图文件
+
+    :param text: 地图文件的内容
+    :param path: 地图路径，用于报错
+    :return: Level对象
+    """
+    lines = text.splitlines()
+    if not lines:
+        raise MapFormatError(path, 1, 1, "empty map")
+    entries = parseHeader(lines[0], path)
+    codes = {config["name"]: i + 1 for i, (kind, config) in enumerate(entries)}
+
+    # trailing blank lines are not rows
+    while len(lines) > 1 and not lines[-1].strip():
+        lines.pop()
+    grid = bytearray()
+    width = None
+    for lineNo, line in enumerate(lines[1:], start=2):
+        column = 1
+        row = 0
+        for cell in line.split(","):
+            name = cell.strip()
+            if name:
+                code = codes.get(name)
+                if code is None:
+                    raise MapFormatError(path, lineNo, column + cell.index(name), "unknown item {!r}".format(name))
+                grid.append(code)
+            else:
+                grid.append(0)
+            column += len(cell) + 1
+            row += 1
+        if width is None:
+            width = row
+        elif row != width:
+            raise MapFormatError(path, lineNo, len(line) + 1, "row has {} cells, expected {}".format(row, width))
+    height = len(lines) - 1
+    if height == 0:
+        raise MapFormatError(path, 2, 1, "map has no rows")
+    if height > 65535 or width > 65535 or len(entries) > 255:
+        raise MapFormatError(path, 1, 1, "map is too large")
+    return Level(entries, width, height, grid)
+
+
+def cachePath(path: str):
+    """
+    :return: 地图对应的二进制缓存路径
+    """
+    return os.path.splitext(path)[0] + CACHE_EXTENSION
+
+
+def writeCache(level: Level, path: str, stat, digest: bytes):
+    """
+    把关卡编译成二进制缓存，先写临时文件再替换，写不了或者有数值超出缓存格式的范围就算了
+
+    :param level: Level对象
+    :param path: 地图路径
+    :param stat: 地图文件的os.stat结果
+    :param digest: 地图文件的sha1
+    """
+    try:
+        parts = [CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, stat.st_mtime_ns, stat.st_size, digest,
+                                   level.width, level.height, len(level.entries))]
+        for kind, config in level.entries:
+            for s in (kind, config["name"], config.get("image", "")):
+                b = s.encode("utf-8")
+                parts.append(struct.pack("<H", len(b)) + b)
+            parts.append(CACHE_ENTRY.pack(config["hp"], config["damage"], int(config["speed"])))
+    except struct.error:
+        # e.g. an hp above int32, the level still loads from the source every time
+        return
+    parts.append(bytes(level.grid))
+    tmp = cachePath(path) + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"".join(parts))
+        os.replace(tmp, cachePath(path))
+    except OSError:
+        pass
+
+
+def readCache(path: str, stat):
+    """
+    用mmap读取二进制缓存，缓存不存在、格式不对或者已经过期时返回None。
+    修改时间和大小都一致时直接使用，否则比较源文件的sha1
+
+    :param path: 地图路径
+    :param stat: 地图文件的os.stat结果
+    :return: Level对象或None
+    """
+    try:
+        with open(cachePath(path), "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        magic, version, mtime, size, digest, width, height, count = CACHE_HEADER.unpack_from(mm, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or size != stat.st_size:
+            raise ValueError
+        if mtime != stat.st_mtime_ns:
+            with open(path, "rb") as f:
+                if hashlib.sha1(f.read()).digest() != digest:
+                    raise ValueError
+        offset = CACHE_HEADER.size
+        entries = []
+        for _ in range(count):
+            strings = []
+            for _ in range(3):
+                n, = struct.unpack_from("<H", mm, offset)
+                strings.append(mm[offset + 2:offset + 2 + n].decode("utf-8"))
+                offset += 2 + n
+            hp, damage, speed = CACHE_ENTRY.unpack_from(mm, offset)
+            offset += CACHE_ENTRY.size
+            kind, name, image = strings
+            config = {"name": name, "hp": hp, "damage": damage, "speed": speed}
+            if kind == "EnemyTank":
+                config["image"] = image
+            entries.append((kind, config))
+        if len(mm) != offset + width * height:
+            raise ValueError
+        return Level(entries, width, height, memoryview(mm)[offset:], mm)
+    except (ValueError, struct.error, UnicodeDecodeError):
+        mm.close()
+        return None
+
+
+def loadLevel(path: str, useCache=True):
+    """
+    加载关卡，优先使用二进制缓存，缓存失效时重新解析源文件并写入缓存
+
+    :param path: 地图路径
+    :param useCache: 是否使用和写入缓存
+    :return: Level对象，用完后调用close
+    """
+    stat = os.stat(path)
+    if useCache:
+        level = readCache(path, stat)
+        if level is not None:
+            return level
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise MapFormatError(path, data[:e.start].count(b"\n") + 1, 1, "map is not valid UTF-8")
+    level = parseMap(text, path)
+    if useCache:
+        writeCache(level, path, stat, hashlib.sha1(data).digest())
+    return level
+
+
+def describeMap(path: str):
+    """
+    只数行和逗号，不解析地图，得到地图的尺寸和头部（第一行）的sha1
+
+    :param path: 地图路径
+    :return: (宽度, 高度, 头部摘要的十六进制字符串)
+    """
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    header = lines[0] if lines else b""
+    rows = lines[1:]
+    # trailing blank lines are not rows, same as parseMap
+    while rows and not rows[-1].strip():
+        rows.pop()
+    return (rows[0].count(b",") + 1 if rows else 0), len(rows), hashlib.sha1(header).hexdigest()
+
+
+def indexLevels(root=".", indexPath=None):
+    """
+    列出root目录（不含子目录）下的所有地图，修改时间和大小都没变的地图直接用索引里记的信息，索引有变化时写回去，写不了就算了
+
+    :param root: 地图所在的目录
+    :param indexPath: 索引文件路径，None为root下的INDEX_PATH
+    :return: 按文件名排好序的LevelInfo列表
+    """
+    if indexPath is None:
+        indexPath = os.path.join(root, INDEX_PATH)
+    try:
+        with open(indexPath, encoding="utf-8") as f:
+            index = json.load(f)
+        cached = index["levels"] if index.get("version") == INDEX_VERSION else {}
+    except (OSError, ValueError, KeyError, AttributeError):
+        cached = {}
+
+    levels = {}
+    changed = False
+    with os.scandir(root) as it:
+        for entry in it:
+            if not entry.name.endswith(MAP_EXTENSION) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            record = cached.get(entry.name)
+            if record is None or record[:2] != [stat.st_mtime_ns, stat.st_size]:
+                record = [stat.st_mtime_ns, stat.st_size, *describeMap(entry.path)]
+                changed = True
+            levels[entry.name] = record
+    if changed or levels.keys() != cached.keys():
+        tmp = indexPath + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "levels": levels}, f)
+            os.replace(tmp, indexPath)
+        except OSError:
+            pass
+    return [LevelInfo(os.path.normpath(os.path.join(root, name)), *levels[name][2:]) for name in sorted(levels)]
+
+
+def findMaps(root="."):
+    """
+    找出目录下所有的地图文件，见indexLevels
+
+    :param root: 地图所在的目录
+    :return: 排好序的地图路径列表
+    """
+    return [level.path for level in indexLevels(root)]
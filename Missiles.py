@@ -0,0 +1,297 @@
+import numpy as np
+
+from Assets import assets
+from Events import events, HIT, KILL
+from Layers import LAYER_MISSILE, COLLIDES_WITH, isHostile
+from Tiles import Tile
+
+# 方向编码，direction数组里存的是这里的下标
+DIRECTIONS = ("UP", "DOWN", "LEFT", "RIGHT")
+DIRECTION_CODES = {direction: i for i, direction in enumerate(DIRECTIONS)}
+# 每个方向每个tick移动一个单位速度的位移
+VELOCITIES = np.array([(0, -1), (0, 1), (-1, 0), (1, 0)], np.int32)
+# 和坦克、基地做碰撞检测的组
+TARGET_GROUPS = ("Base", "FriendlyTank", "EnemyTank")
+
+
+class MissileSystem:
+    """
+    导弹的对象池，以结构数组（structure of arrays）的形式存储所有导弹的位置、速度、方向、发射者、伤害和血量，
+    每个tick用一次向量化运算推进所有导弹并清除越界的导弹，被清除的槽位放回空闲列表重复使用，不再为每发导弹创建精灵。
+    所有导弹共享一份预旋转的图片和碰撞遮罩，碰撞规则和原来Missal类的attack方法一致
+    """
+
+    def __init__(self, gameMap, capacity=256):
+        """
+        :param gameMap: GameMap对象
+        :param capacity: 初始槽位数，不够时翻倍
+        """
+        self.gameMap = gameMap
+        # 图片是朝右的，先转成向上的
+        self.asset = assets.get("images/Missal.png", (20, 10), 270)
+        # (width, height) of the mask per direction code
+        self.sizes = np.array([self.asset.masks[d].get_size() for d in DIRECTIONS], np.int32)
+        # 遮罩没有透明像素时，两发导弹的矩形重叠就是相撞，不用再逐像素比较
+        self.solid = all(self.asset.masks[d].count() == w * h for d, (w, h) in zip(DIRECTIONS, self.sizes))
+        self.capacity = 0
+        self.alive = np.zeros(0, bool)
+        self.position = np.zeros((0, 2), np.int32)
+        self.velocity = np.zeros((0, 2), np.int32)
+        self.direction = np.zeros(0, np.int8)
+        self.owner = np.zeros(0, np.int32)
+        self.damage = np.zeros(0, np.int32)
+        self.hp = np.zeros(0, np.int32)
+        # 空闲槽位的栈，栈顶是最小的槽位
+        self.free = []
+        self.count = 0
+        self.grow(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, capacity: int):
+        """
+        把所有数组扩大到capacity个槽位
+
+        :param capacity: 新的槽位数
+        """
+        extra = capacity - self.capacity
+        self.alive = np.concatenate([self.alive, np.zeros(extra, bool)])
+        self.position = np.concatenate([self.position, np.zeros((extra, 2), np.int32)])
+        self.velocity = np.concatenate([self.velocity, np.zeros((extra, 2), np.int32)])
+        self.direction = np.concatenate([self.direction, np.zeros(extra, np.int8)])
+        self.owner = np.concatenate([self.owner, np.zeros(extra, np.int32)])
+        self.damage = np.concatenate([self.damage, np.zeros(extra, np.int32)])
+        self.hp = np.concatenate([self.hp, np.zeros(extra, np.int32)])
+        self.free = list(range(capacity - 1, self.capacity - 1, -1)) + self.free
+        self.capacity = capacity
+
+    def spawn(self, owner, topleft: tuple, direction: str, speed: int, damage: int):
+        """
+        发射一发导弹，在一个50*50的格子里居中对齐20*10的图像，需要将topleft加20和15
+
+        :param owner: 发射导弹的坦克，需要已经分配过实体编号
+        :param topleft: 导弹所在格子的左上角坐标
+        :param direction: 方向
+        :param speed: 每个tick移动的像素数
+        :param damage: 伤害
+        :return: 槽位编号
+        """
+        if not self.free:
+            self.grow(self.capacity * 2)
+        slot = self.free.pop()
+        code = DIRECTION_CODES[direction]
+        self.alive[slot] = True
+        self.position[slot] = (topleft[0] + 20, topleft[1] + 15)
+        self.velocity[slot] = VELOCITIES[code] * speed
+        self.direction[slot] = code
+        self.owner[slot] = owner.entityId
+        self.damage[slot] = damage
+        # 所有子弹的HP固定为1
+        self.hp[slot] = 1
+        self.count += 1
+        return slot
+
+    def kill(self, slot: int):
+        """
+        清除一发导弹，把槽位放回空闲列表
+        """
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.hp[slot] = 0
+            self.free.append(int(slot))
+            self.count -= 1
+
+    def slots(self):
+        """
+        :return: 所有存活导弹的槽位编号数组，从小到大
+        """
+        return np.flatnonzero(self.alive)
+
+    def step(self):
+        """
+        推进一个tick：所有导弹同时移动，清除左上角越界的导弹
+        """
+        slots = self.slots()
+        if not len(slots):
+            return
+        self.position[slots] += self.velocity[slots]
+        x, y = self.position[slots, 0], self.position[slots, 1]
+        out = (x < 0) | (y < 0) | (x > self.gameMap.width - 49) | (y > self.gameMap.height - 49)
+        for slot in slots[out]:
+            self.kill(slot)
+
+    def applyDamage(self, slot: int, damage: int, source=None):
+        """
+        对一发导弹应用伤害，血量归零时清除
+
+        :param slot: 槽位编号
+        :param damage: 伤害
+        :param source: 造成伤害的物体，用于统计
+        """
+        hp = int(self.hp[slot])
+        if hp <= 0:
+            return
+        if hp - damage <= 0:
+            damage = hp
+            self.kill(slot)
+            if events.enabled[HIT]:
+                events.emit(HIT, slot, source, damage, 0)
+            if events.enabled[KILL]:
+                events.emit(KILL, slot, source)
+        else:
+            self.hp[slot] = hp - damage
+            if events.enabled[HIT]:
+                events.emit(HIT, slot, source, damage, hp - damage)
+        self.gameMap.recordDamage(source, None, damage)
+
+    def ownerOf(self, slot: int):
+        """
+        :return: 发射这发导弹的坦克，坦克已经被摧毁时为None
+        """
+        return self.gameMap.occupancy.entities.get(int(self.owner[slot]))
+
+    def hit(self, slot: int, obj):
+        """
+        导弹碰到物体，规则和原来的Missal.attack一样：只对敌对阵营造成伤害，碰到可见的物体导弹自己都会受到对方的伤害，
+        发射者已经被摧毁的导弹不会再造成任何效果
+
+        :param slot: 槽位编号
+        :param obj: 碰到的物体，精灵或者Tile对象
+        """
+        if obj.invisible:
+            return
+        owner = self.ownerOf(slot)
+        if owner is None or not owner.alive():
+            return
+        if isHostile(owner.team, obj.team):
+            # attack enemy
+            obj.applyDamage(int(self.damage[slot]), owner)
+        self.applyDamage(slot, obj.damage, obj)
+
+    def hitMissile(self, slot: int, other: int):
+        """
+        两发导弹相撞，不管阵营总是互相造成伤害
+
+        :param slot: 槽位编号
+        :param other: 另一发导弹的槽位编号
+        """
+        owner = self.ownerOf(slot)
+        if owner is None or not owner.alive():
+            return
+        damage = int(self.damage[other])
+        self.applyDamage(other, int(self.damage[slot]), owner)
+        self.applyDamage(slot, damage, self.ownerOf(other))
+
+    def overlaps(self, slot: int, mask, topleft: tuple):
+        """
+        精确检测：导弹的遮罩和另一个遮罩是否重叠
+
+        :param mask: 另一个物体的遮罩
+        :param topleft: 另一个物体的左上角坐标
+        """
+        x, y = self.position[slot]
+        return mask.overlap(self.maskOf(slot), (int(x) - topleft[0], int(y) - topleft[1])) is not None
+
+    def collide(self):
+        """
+        碰撞检测。坦克和基地很少，对每个目标用一次向量化的矩形比较找出候选导弹，不会和导弹碰撞的层、
+        还没出现的坦克和导弹自己的发射者在比较之前就排除掉；
+        图块和导弹之间的检测都按导弹覆盖到的格子分桶，只有落在有图块的格子或者和别的导弹同格且矩形重叠的才需要精确检测。
+        候选全部找出来之后再按槽位顺序结算
+        """
+        slots = self.slots()
+        if not len(slots):
+            return
+        m = self.gameMap
+        x, y = self.position[slots, 0], self.position[slots, 1]
+        size = self.sizes[self.direction[slots]]
+        right, bottom = x + size[:, 0], y + size[:, 1]
+        owners = self.owner[slots]
+        # slot -> list of (kind, target)
+        hits = {}
+
+        for key in TARGET_GROUPS:
+            group = m.groups.get(key)
+            if group is None:
+                continue
+            for sprite in group.sprites():
+                if sprite.invisible or not COLLIDES_WITH[LAYER_MISSILE] & sprite.layer:
+                    continue
+                width, height = sprite.mask.get_size()
+                left, top = sprite.rect.topleft
+                near = (x < left + width) & (left < right) & (y < top + height) & (top < bottom)
+                # a missile never hits the tank that fired it
+                near &= owners != sprite.entityId
+                for slot in slots[near]:
+                    if self.overlaps(slot, sprite.mask, (left, top)):
+                        hits.setdefault(int(slot), []).append((0, sprite))
+
+        # every cell covered by a missile, at most 2*2 because a missile is smaller than a cell,
+        # encoded as cell * n + index so that one sort both removes duplicates and groups the missiles by cell
+        n = len(slots)
+        height = m.occupancy.height
+        codes = [(cx.astype(np.int64) * height + cy) * n + np.arange(n)
+                 for cx in (x // 50, (right - 1) // 50) for cy in (y // 50, (bottom - 1) // 50)]
+        codes = np.unique(np.concatenate(codes))
+        keys, i = np.divmod(codes, n)
+        cx, cy = np.divmod(keys, height)
+
+        onTile = np.isin(m.occupancy.cellType[cx, cy], list(m.tiles.types))
+        for k, tx, ty in zip(i[onTile], cx[onTile], cy[onTile]):
+            tile = Tile(m.tiles, int(tx), int(ty))
+            if self.overlaps(slots[k], tile.mask, tile.rect.topleft):
+                hits.setdefault(int(slots[k]), []).append((1, tile))
+
+        # missiles sharing a cell: the members of a cell are contiguous in the sorted codes,
+        # so comparing each entry with the one d places ahead for growing d finds all the pairs
+        first, second = [], []
+        d = 1
+        while d < len(keys):
+            same = keys[d:] == keys[:-d]
+            if not same.any():
+                break
+            first.append(i[:-d][same])
+            second.append(i[d:][same])
+            d += 1
+        if first:
+            a, b = np.concatenate(first), np.concatenate(second)
+            near = (x[a] < right[b]) & (x[b] < right[a]) & (y[a] < bottom[b]) & (y[b] < bottom[a])
+            a, b = slots[a[near]], slots[b[near]]
+            pairs = np.unique(np.minimum(a, b).astype(np.int64) * self.capacity + np.maximum(a, b))
+            for a, b in zip(*np.divmod(pairs, self.capacity)):
+                a, b = int(a), int(b)
+                if self.solid or self.overlaps(a, self.maskOf(b), tuple(int(v) for v in self.position[b])):
+                    hits.setdefault(a, []).append((2, b))
+
+        for slot in sorted(hits):
+            # already destroyed by a missile with a smaller slot in this tick
+            if not self.alive[slot]:
+                continue
+            for kind, target in hits[slot]:
+                if kind == 2:
+                    self.hitMissile(slot, target)
+                elif target.alive():
+                    # a sprite killed or a tile cleared by an earlier hit in this tick is not hit again
+                    self.hit(slot, target)
+
+    def maskOf(self, slot: int):
+        """
+        :return: 导弹当前方向的碰撞遮罩
+        """
+        return self.asset.masks[DIRECTIONS[self.direction[slot]]]
+
+    def blits(self, view=None):
+        """
+        :param view: 摄像机看到的世界矩形，只返回和它有重叠的导弹，坐标换算成屏幕坐标，None为全部导弹、世界坐标
+        :return: 存活导弹的(图片, 左上角坐标)列表，供渲染器调用screen.blits
+        """
+        slots = self.slots()
+        position = self.position[slots]
+        if view is not None:
+            size = self.sizes[self.direction[slots]]
+            inside = ((position[:, 0] + size[:, 0] > view.left) & (position[:, 0] < view.right) &
+                      (position[:, 1] + size[:, 1] > view.top) & (position[:, 1] < view.bottom))
+            slots, position = slots[inside], position[inside] - view.topleft
+        images = [self.asset.images[d] for d in DIRECTIONS]
+        return [(images[d], (int(x), int(y))) for d, (x, y) in zip(self.direction[slots], position)]
@@ -0,0 +1,277 @@
+import heapq
+
+import numpy as np
+
+from Occupancy import EMPTY, WALL, METAL_WALL
+
+# 距离场里无法到达的格子
+UNREACHABLE = float("inf")
+# 穿过一格砖墙的代价，砖墙要先打掉才能过去，所以比空地贵
+WALL_COST = 5
+
+# 方向和对应的格子偏移，顺序决定了距离相同时的选择
+DIRECTIONS = (("UP", 0, -1), ("DOWN", 0, 1), ("LEFT", -1, 0), ("RIGHT", 1, 0))
+OFFSETS = {direction: (dx, dy) for direction, dx, dy in DIRECTIONS}
+
+
+class FlowField:
+    """
+    到某一个目标格子的距离场（flow field），记录了地图上每一格走到目标的最小代价，所有敌方坦克共享。
+    距离场存在和代价网格一样带一圈边框的一维数组里，边框不可通过，所以找相邻格子时不用判断越界
+    """
+
+    def __init__(self, targetCell: tuple, costs):
+        """
+        从目标格子反向计算整个距离场。代价只有1和WALL_COST两种，所以按距离分桶（Dial算法），
+        同一个距离的所有格子用numpy一次松弛，结果和Dijkstra完全一样
+
+        :param targetCell: 目标格子坐标
+        :param costs: Navigator.buildCosts生成的带边框的代价网格，0为不可通过
+        """
+        self.targetCell = targetCell
+        self.width, self.height = costs.shape[0] - 2, costs.shape[1] - 2
+        self.stride = costs.shape[1]
+        self.distance = np.full(costs.size, UNREACHABLE)
+        tx, ty = targetCell
+        if not (0 <= tx < self.width and 0 <= ty < self.height):
+            return
+        cost = costs.ravel()
+        neighbours = np.array([dx * self.stride + dy for _, dx, dy in DIRECTIONS])
+        target = self.index(targetCell)
+        self.distance[target] = 0
+        # ring of buckets, a relaxation reaches at most WALL_COST levels ahead so the slots never collide
+        buckets = [[] for _ in range(WALL_COST + 1)]
+        buckets[0].append(np.array([target]))
+        owner = np.empty(costs.size, dtype=np.int64)
+        pending = 1
+        level = 0
+        while pending:
+            slot = buckets[level % len(buckets)]
+            if slot:
+                pending -= len(slot)
+                cells = np.concatenate(slot) if len(slot) > 1 else slot[0]
+                slot.clear()
+                # a cell may have been queued again with a smaller distance since
+                cells = cells[self.distance[cells] == level]
+                candidates = (cells[:, None] + neighbours).ravel()
+                stepCost = cost[candidates]
+                better = (stepCost > 0) & (level + stepCost < self.distance[candidates])
+                candidates, stepCost = candidates[better], stepCost[better]
+                # the same cell reached from two cells of this level is only queued once
+                order = np.arange(candidates.size)
+                owner[candidates] = order
+                unique = owner[candidates] == order
+                candidates, stepCost = candidates[unique], stepCost[unique]
+                self.distance[candidates] = level + stepCost
+                for value in (1, WALL_COST):
+                    reached = candidates[stepCost == value]
+                    if reached.size:
+                        buckets[(level + value) % len(buckets)].append(reached)
+                        pending += 1
+            level += 1
+
+    def index(self, cell: tuple):
+        """
+        :param cell: 格子坐标
+        :return: 格子在带边框的一维数组里的下标
+        """
+        return (cell[0] + 1) * self.stride + cell[1] + 1
+
+    def wallDestroyed(self, cell: tuple, costs):
+        """
+        砖墙被摧毁时调用，格子的代价只会变小，所以只要从这个格子出发做一次局部的Dijkstra，
+        把变短的距离往外传，距离没变的格子不会被访问
+
+        :param cell: 格子坐标，代价已经在costs里改好
+        :param costs: 带边框的代价网格
+        """
+        x, y = cell
+        if not (0 <= x < self.width and 0 <= y < self.height) or cell == self.targetCell:
+            return
+        cost = costs.ravel()
+        distance = self.distance
+        start = self.index(cell)
+        d = min(distance[start + dx * self.stride + dy] for _, dx, dy in DIRECTIONS) + cost[start]
+        if d >= distance[start]:
+            return
+        distance[start] = d
+        heap = [(d, start)]
+        while heap:
+            d, i = heapq.heappop(heap)
+            if d > distance[i]:
+                continue
+            for _, dx, dy in DIRECTIONS:
+                n = i + dx * self.stride + dy
+                if cost[n] and d + cost[n] < distance[n]:
+                    distance[n] = d + cost[n]
+                    heapq.heappush(heap, (distance[n], n))
+
+    def distanceAt(self, cell: tuple):
+        """
+        :param cell: 格子坐标
+        :return: 从该格子到目标的最小代价
+        """
+        x, y = cell
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return float(self.distance[self.index(cell)])
+        return UNREACHABLE
+
+    def nextDirection(self, cell: tuple):
+        """
+        查询从某一格出发下一步应该走的方向，只需要比较四个相邻格子
+
+        :param cell: 格子坐标
+        :return: 方向，已经在目标上或者无法到达时返回None
+        """
+        best = self.distanceAt(cell)
+        bestDirection = None
+        for direction, dx, dy in DIRECTIONS:
+            d = self.distanceAt((cell[0] + dx, cell[1] + dy))
+            if d < best:
+                best = d
+                bestDirection = direction
+        return bestDirection
+
+
+class Navigator:
+    """
+    导航子系统，每个目标维护一个距离场，只有目标换了格子时才重新计算，砖墙被摧毁时在原来的距离场上局部修补
+    """
+
+    def __init__(self, gameMap):
+        """
+        :param gameMap: GameMap对象
+        """
+        self.gameMap = gameMap
+        self.costs = None
+        # target name -> FlowField
+        self.fields = {}
+
+    def buildCosts(self):
+        """
+        根据占用网格生成每个格子的通过代价，无敌的物体（金属墙）不可通过，砖墙代价为WALL_COST。
+        代价网格四周多一圈不可通过的边框，[x + 1, y + 1]对应格子(x, y)，0为不可通过
+        """
+        occupancy = self.gameMap.occupancy
+        blocked = (occupancy.cellType != EMPTY) & (occupancy.hp < 0)
+        walls = occupancy.cellType == WALL
+        self.costs = np.zeros((occupancy.width + 2, occupancy.height + 2), dtype=np.int64)
+        self.costs[1:-1, 1:-1] = np.where(blocked, 0, np.where(walls, WALL_COST, 1))
+
+    def wallDestroyed(self, cell: tuple):
+        """
+        砖墙被摧毁时调用，修改该格子的代价，并局部修补所有距离场
+
+        :param cell: 格子坐标
+        """
+        if self.costs is None:
+            return
+        x, y = cell
+        self.costs[x + 1, y + 1] = 1
+        for field in self.fields.values():
+            field.wallDestroyed(cell, self.costs)
+
+    def field(self, name: str, targetCell: tuple):
+        """
+        获取到某个目标的距离场，目标换了格子时重新计算
+
+        :param name: 目标的名字，例如"Base"、"FriendlyTank"
+        :param targetCell: 目标当前所在的格子
+        :return: FlowField对象
+        """
+        if self.costs is None:
+            self.buildCosts()
+        field = self.fields.get(name)
+        if field is None or field.targetCell != targetCell:
+            field = FlowField(targetCell, self.costs)
+            self.fields[name] = field
+        return field
+
+
+class LineOfSight:
+    """
+    按行和按列的视线索引。每一行（列）被墙分成若干段，每个格子记下它在本行（本列）是第几段，
+    同一行（列）的两个格子段号相同就说明中间没有墙，查询是O(1)的。墙被摧毁时只重新计算它所在的那一行和那一列
+    """
+
+    # 挡住视线（和导弹）的格子类型
+    BLOCKING = (WALL, METAL_WALL)
+
+    def __init__(self, gameMap):
+        """
+        :param gameMap: GameMap对象
+        """
+        self.gameMap = gameMap
+        self.blocked = None
+        # segment number of every cell along its row / column, [x, y]
+        self.rowSegment = None
+        self.columnSegment = None
+
+    def build(self):
+        """
+        根据占用网格计算所有的段号
+        """
+        self.blocked = np.isin(self.gameMap.occupancy.cellType, self.BLOCKING)
+        # the number of walls up to a cell is the same for every cell of one open segment
+        self.rowSegment = np.cumsum(self.blocked, axis=0, dtype=np.int32)
+        self.columnSegment = np.cumsum(self.blocked, axis=1, dtype=np.int32)
+
+    def wallDestroyed(self, cell: tuple):
+        """
+        墙被摧毁时调用，重新计算它所在的行和列
+
+        :param cell: 格子坐标
+        """
+        if self.blocked is None:
+            return
+        x, y = cell
+        self.blocked[x, y] = False
+        self.rowSegment[:, y] = np.cumsum(self.blocked[:, y], dtype=np.int32)
+        self.columnSegment[x, :] = np.cumsum(self.blocked[x, :], dtype=np.int32)
+
+    def visible(self, cell: tuple, direction: str, target: tuple, distance=None):
+        """
+        从一个格子朝一个方向看，能不能看到目标格子。视线从前方的格子开始算，所以站在砖墙里的坦克也能往外看
+
+        :param cell: 出发的格子
+        :param direction: 朝向
+        :param target: 目标格子
+        :param distance: 最远能看到多少格，None为不限制
+        :return: 目标是否在视线内
+        """
+        if self.blocked is None:
+            self.build()
+        x, y = cell
+        tx, ty = target
+        if direction in ("LEFT", "RIGHT"):
+            offset = tx - x if direction == "RIGHT" else x - tx
+            if ty != y or offset <= 0 or (distance is not None and offset > distance):
+                return False
+            nx = x + (1 if direction == "RIGHT" else -1)
+            return not self.blocked[tx, ty] and not self.blocked[nx, y] and \
+                self.rowSegment[nx, y] == self.rowSegment[tx, ty]
+        offset = ty - y if direction == "DOWN" else y - ty
+        if tx != x or offset <= 0 or (distance is not None and offset > distance):
+            return False
+        ny = y + (1 if direction == "DOWN" else -1)
+        return not self.blocked[tx, ty] and not self.blocked[x, ny] and \
+            self.columnSegment[x, ny] == self.columnSegment[tx, ty]
+
+    def blockedAt(self, cell: tuple):
+        """
+        :param cell: 格子坐标
+        :return: 该格子是否挡住视线，地图外面算挡住
+        """
+        if self.blocked is None:
+            self.build()
+        x, y = cell
+        width, height = self.blocked.shape
+        return not (0 <= x < width and 0 <= y < height) or bool(self.blocked[x, y])
+
+
+def cellOf(sprite):
+    """
+    :param sprite: 精灵对象
+    :return: 精灵中心所在的格子坐标
+    """
+    return sprite.rect.centerx // 50, sprite.rect.centery // 50
@@ -0,0 +1,156 @@
+import numpy as np
+
+# 格子类型，各个物体类的cellType类属性取这些值
+EMPTY = 0
+WALL = 1
+METAL_WALL = 2
+BASE = 3
+FRIENDLY_TANK = 4
+ENEMY_TANK = 5
+
+
+class OccupancyGrid:
+    """
+    权威的占用网格，由GameMap持有，所有数组都以[x, y]索引，和地图的格子一一对应。
+    静态层记录墙和基地的类型、实体编号和血量（墙是图块，没有实体编号），单位层记录坦克的类型和实体编号（坦克可以开进砖墙，所以单独一层）。
+    物体出现、移动结束、受到伤害和被摧毁时同步更新，移动、AI和碰撞检测都从这里做O(1)查询
+    """
+
+    def __init__(self, width: int, height: int):
+        """
+        :param width: 地图宽度（格子数）
+        :param height: 地图高度（格子数）
+        """
+        self.width = width
+        self.height = height
+        self.cellType = np.zeros((width, height), np.int8)
+        self.entityId = np.zeros((width, height), np.int32)
+        self.hp = np.zeros((width, height), np.int32)
+        self.unitType = np.zeros((width, height), np.int8)
+        self.unitId = np.zeros((width, height), np.int32)
+        # entity id -> item, 0 means no entity
+        self.entities = {}
+        # every entity ever registered, including destroyed ones, so that a snapshot can bring them back
+        self.registry = {}
+        # entity id -> cell of a unit
+        self.unitCells = {}
+        self.nextId = 1
+
+    def register(self, item):
+        """
+        给物体分配实体编号，不放到网格上
+
+        :param item: 物体
+        :return: 实体编号
+        """
+        item.entityId = self.nextId
+        self.entities[self.nextId] = item
+        self.registry[self.nextId] = item
+        self.nextId += 1
+        return item.entityId
+
+    def place(self, item):
+        """
+        把物体放到它当前所在的格子上，坦克放在单位层，其余放在静态层
+
+        :param item: 已经分配过实体编号的物体
+        """
+        x, y = item.rect.centerx // 50, item.rect.centery // 50
+        if not self.inBounds(x, y):
+            return
+        cellType = item.cellType
+        if cellType in (FRIENDLY_TANK, ENEMY_TANK):
+            self.vacate(item)
+            self.unitType[x, y] = cellType
+            self.unitId[x, y] = item.entityId
+            self.unitCells[item.entityId] = (x, y)
+        else:
+            self.cellType[x, y] = cellType
+            self.entityId[x, y] = item.entityId
+            self.hp[x, y] = item.hp
+
+    def vacate(self, item):
+        """
+        把坦克从单位层上它原来的格子里移走，格子已经被别的坦克占了就不动
+
+        :param item: 坦克
+        """
+        cell = self.unitCells.pop(item.entityId, None)
+        if cell is not None and self.unitId[cell] == item.entityId:
+            self.unitType[cell] = EMPTY
+            self.unitId[cell] = 0
+
+    def updateHp(self, item):
+        """
+        同步静态物体的血量
+
+        :param item: 物体
+        """
+        x, y = item.rect.centerx // 50, item.rect.centery // 50
+        if self.inBounds(x, y) and self.entityId[x, y] == item.entityId:
+            self.hp[x, y] = item.hp
+
+    def remove(self, item):
+        """
+        物体被摧毁时调用，从网格和实体表中移除
+
+        :param item: 物体
+        """
+        if not item.entityId:
+            return
+        self.vacate(item)
+        x, y = item.rect.centerx // 50, item.rect.centery // 50
+        if self.inBounds(x, y) and self.entityId[x, y] == item.entityId:
+            self.cellType[x, y] = EMPTY
+            self.entityId[x, y] = 0
+            self.hp[x, y] = 0
+        self.entities.pop(item.entityId, None)
+
+    def inBounds(self, x: int, y: int):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def typeAt(self, x: int, y: int):
+        """
+        :return: 静态层的格子类型
+        """
+        return int(self.cellType[x, y])
+
+    def entityAt(self, x: int, y: int):
+        """
+        :return: 静态层格子上的物体，没有则为None
+        """
+        return self.entities.get(int(self.entityId[x, y]))
+
+    def unitAt(self, x: int, y: int):
+        """
+        :return: 单位层格子上的坦克，没有则为None
+        """
+        return self.entities.get(int(self.unitId[x, y]))
+
+    def isBlocked(self, x: int, y: int):
+        """
+        格子是否不可通过，无敌的物体（血量为负数，例如金属墙）不可通过
+
+        :return: True - 不可通过
+        """
+        return self.cellType[x, y] != EMPTY and self.hp[x, y] < 0
+
+    def freeCells(self):
+        """
+        :return: 所有既没有静态物体也没有坦克的格子，形状为(n, 2)的数组，每行为(x, y)
+        """
+        return np.argwhere((self.cellType == EMPTY) & (self.unitType == EMPTY))
+
+    def destructibleCells(self, left=0, top=0, right=None, bottom=None):
+        """
+        查询一个矩形区域内所有可以被摧毁的静态物体所在的格子
+
+        :param left: 区域左边界（含）
+        :param top: 区域上边界（含）
+        :param right: 区域右边界（不含），None为地图右边界
+        :param bottom: 区域下边界（不含），None为地图下边界
+        :return: 形状为(n, 2)的数组，每行为(x, y)
+        """
+        region = (slice(left, right), slice(top, bottom))
+        cells = np.argwhere((self.cellType[region] != EMPTY) & (self.hp[region] > 0))
+        return cells + (left, top)
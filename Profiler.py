@@ -0,0 +1,164 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+
+import pygame
+
+# 一帧里的各个阶段，没有归到任何阶段的时间算作other
+PHASES = ("events", "ai", "move", "collide", "draw", "present", "idle")
+
+
+class FrameProfiler:
+    """
+    逐帧的分阶段计时器。游戏循环在帧开始时调用startFrame，每个阶段结束时调用lap，帧结束时调用endFrame，
+    同一帧里跑了多个tick时同一个阶段的时间累加。
+    调用方先检查enabled再调用，关闭时只有一次属性读取的开销
+    """
+
+    def __init__(self, window=300):
+        """
+        :param window: 计算帧率和分位数时使用的最近帧数
+        """
+        self.enabled = False
+        self.window = window
+        # 是否保留每一帧供export导出，不保留时只留最近window帧，长时间开着浮层也不会越占越多内存
+        self.keepFrames = False
+        self.frameCount = 0
+        # every finished frame when keepFrames is set: (frame number, frame ms, phase ms in PHASES order + other,
+        # ticks, entity counts)
+        self.frames = []
+        self.recent = deque(maxlen=window)
+        self.frameStart = None
+        self.lastLap = None
+        self.phaseTimes = [0.0] * len(PHASES)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.frameStart = None
+
+    def startFrame(self):
+        """
+        开始一帧
+        """
+        self.frameStart = self.lastLap = time.perf_counter()
+        self.phaseTimes = [0.0] * len(PHASES)
+
+    def lap(self, phase: str):
+        """
+        把上一次lap（或者帧开始）到现在的时间算到phase阶段
+
+        :param phase: PHASES里的阶段名
+        """
+        if self.frameStart is None:
+            return
+        now = time.perf_counter()
+        self.phaseTimes[PHASES.index(phase)] += now - self.lastLap
+        self.lastLap = now
+
+    def endFrame(self, ticks=0, counts=None):
+        """
+        结束一帧并记录下来
+
+        :param ticks: 这一帧推进的tick数
+        :param counts: 各个精灵组的物体数量
+        """
+        if self.frameStart is None:
+            return
+        total = time.perf_counter() - self.frameStart
+        phases = [t * 1000 for t in self.phaseTimes]
+        phases.append(max(total * 1000 - sum(phases), 0.0))
+        frame = (self.frameCount, total * 1000, phases, ticks, counts or {})
+        self.frameCount += 1
+        if self.keepFrames:
+            self.frames.append(frame)
+        self.recent.append(frame)
+        self.frameStart = None
+
+    def summary(self):
+        """
+        :return: 最近window帧的统计：fps、帧时间的p50和p99（毫秒）、各阶段的平均耗时（毫秒），没有数据时为None
+        """
+        if not self.recent:
+            return None
+        times = sorted(frame[1] for frame in self.recent)
+        n = len(times)
+        averages = [sum(frame[2][i] for frame in self.recent) / n for i in range(len(PHASES) + 1)]
+        return {
+            "fps": 1000 * n / sum(times) if sum(times) > 0 else 0.0,
+            "p50": times[(n - 1) // 2],
+            "p99": times[min(n - 1, int(n * 0.99))],
+            "phases": dict(zip(PHASES + ("other",), averages)),
+            "counts": self.recent[-1][4],
+        }
+
+    def export(self, path: str):
+        """
+        把所有帧的计时导出，扩展名为.csv时写CSV，否则写JSON。没有打开keepFrames时只有最近window帧
+
+        :param path: 文件路径
+        """
+        frames = self.frames if self.keepFrames else list(self.recent)
+        groups = sorted({key for frame in frames for key in frame[4]})
+        header = ["frame", "frameMs"] + ["{}Ms".format(p) for p in PHASES + ("other",)] + ["ticks"] + groups
+        rows = [[number, round(total, 4)] + [round(p, 4) for p in phases] + [ticks] + [counts.get(g, 0) for g in groups]
+                for number, total, phases, ticks, counts in frames]
+        if os.path.splitext(path)[1] == ".csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as f:
+                json.dump({"summary": self.summary(), "frames": [dict(zip(header, row)) for row in rows]}, f)
+
+
+class HudOverlay:
+    """
+    屏幕左上角的性能信息浮层：帧率、帧时间的p50/p99、各阶段的平均耗时和各组的物体数量，
+    每隔一段时间才重新渲染一次文字
+    """
+
+    def __init__(self, profiler: FrameProfiler, refreshFrames=15):
+        """
+        :param profiler: FrameProfiler对象
+        :param refreshFrames: 每隔多少帧重新渲染一次
+        """
+        self.profiler = profiler
+        self.refreshFrames = refreshFrames
+        self.font = pygame.font.SysFont(None, 18)
+        self.surface = None
+        self.age = refreshFrames
+
+    def render(self):
+        """
+        :return: 浮层的Surface，还没有数据时为None
+        """
+        self.age += 1
+        if self.age < self.refreshFrames and self.surface is not None:
+            return self.surface
+        self.age = 0
+        summary = self.profiler.summary()
+        if summary is None:
+            return self.surface
+        lines = ["{:.0f} fps  p50 {:.1f} ms  p99 {:.1f} ms".format(summary["fps"], summary["p50"], summary["p99"])]
+        lines += ["{:<8} {:6.2f} ms".format(phase, ms) for phase, ms in summary["phases"].items()]
+        lines.append("  ".join("{} {}".format(key, n) for key, n in summary["counts"].items() if n))
+        images = [self.font.render(line, True, (255, 255, 0)) for line in lines]
+        width = max(image.get_width() for image in images) + 8
+        height = sum(image.get_height() for image in images) + 8
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 160))
+        y = 4
+        for image in images:
+            self.surface.blit(image, (4, y))
+            y += image.get_height()
+        return self.surface
+
+
+# 全局的分阶段计时器，默认关闭
+profiler = FrameProfiler()
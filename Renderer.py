@@ -0,0 +1,157 @@
+from collections import OrderedDict
+
+import pygame
+from Camera import Camera, CHUNK_CELLS, CHUNK_SIZE
+from Profiler import profiler
+from Scheduler import TickScheduler
+
+
+class Renderer:
+    """
+    脏矩形渲染器，只画摄像机看得到的部分。静态的砖墙、金属墙图块和基地按块烘焙到背景Surface上，
+    块第一次出现在窗口里时才烘焙，之后只重新烘焙被打坏的格子；摄像机不动时每帧只擦掉上一帧会动的物体的位置、
+    画出它们的新位置，并且只把变化的矩形提交到屏幕，摄像机移动时从缓存的背景块重画整个窗口。
+    """
+
+    # 除了图块之外烘焙到背景里的组
+    STATIC_GROUPS = ("Base",)
+    # 最多缓存的背景块数，超过时丢掉最久没用过的
+    MAX_CHUNKS = 64
+
+    def __init__(self, gameMap, screen, camera=None):
+        """
+        :param gameMap: GameMap对象
+        :param screen: 屏幕Surface
+        :param camera: Camera对象，None为固定不动、和屏幕一样大的摄像机
+        """
+        self.gameMap = gameMap
+        self.screen = screen
+        self.camera = camera or Camera(gameMap, screen.get_size())
+        # chunk -> baked background Surface, least recently used first
+        self.chunks = OrderedDict()
+        # areas the moving sprites and missiles were drawn at in the last frame, in screen coordinates
+        self.lastRects = []
+        # camera position of the last frame
+        self.lastView = None
+        self.fullRedraw = True
+        # 画在最上层的浮层Surface，例如性能信息，None为没有
+        self.overlay = None
+        self.bake()
+
+    def bake(self):
+        """
+        丢掉所有烘焙好的背景块，用到时重新烘焙
+        """
+        self.chunks.clear()
+        self.gameMap.dirtyCells.clear()
+        self.fullRedraw = True
+
+    def chunk(self, key: tuple):
+        """
+        获取一个块的背景，没有时烘焙
+
+        :param key: 块的坐标
+        :return: 背景Surface
+        """
+        surface = self.chunks.get(key)
+        if surface is not None:
+            self.chunks.move_to_end(key)
+            return surface
+        surface = pygame.Surface((CHUNK_SIZE, CHUNK_SIZE)).convert()
+        surface.fill((0, 0, 0))
+        left, top = key[0] * CHUNK_CELLS, key[1] * CHUNK_CELLS
+        self.gameMap.tiles.draw(surface, (left, top, left + CHUNK_CELLS, top + CHUNK_CELLS))
+        area = pygame.Rect(key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+        for name in self.STATIC_GROUPS:
+            for sprite in self.gameMap.groups.get(name, ()):
+                if area.colliderect(sprite.rect):
+                    surface.blit(sprite.image, sprite.rect.move(-area.left, -area.top))
+        self.chunks[key] = surface
+        if len(self.chunks) > self.MAX_CHUNKS:
+            self.chunks.popitem(last=False)
+        return surface
+
+    def rebake(self):
+        """
+        重新烘焙地图标记为脏的格子，还没有烘焙过的块不用管
+
+        :return: 重新烘焙的矩形列表，世界坐标
+        """
+        rects = []
+        while self.gameMap.dirtyCells:
+            x, y = self.gameMap.dirtyCells.pop()
+            rect = pygame.Rect(x * 50, y * 50, 50, 50)
+            rects.append(rect)
+            key = (x // CHUNK_CELLS, y // CHUNK_CELLS)
+            surface = self.chunks.get(key)
+            if surface is None:
+                continue
+            origin = (key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE)
+            surface.fill((0, 0, 0), rect.move(-origin[0], -origin[1]))
+            item = self.gameMap.occupancy.entityAt(x, y)
+            if item is not None:
+                surface.blit(item.image, item.rect.move(-origin[0], -origin[1]))
+            else:
+                self.gameMap.tiles.drawCell(surface, x, y, origin)
+        return rects
+
+    def restore(self, rect):
+        """
+        用背景块把屏幕上的一块区域恢复成背景
+
+        :param rect: 屏幕坐标的矩形
+        """
+        view = self.camera.rect
+        world = rect.move(view.left, view.top).clip(view)
+        if not world.width or not world.height:
+            return
+        left, top = world.left // CHUNK_SIZE, world.top // CHUNK_SIZE
+        right, bottom = (world.right - 1) // CHUNK_SIZE, (world.bottom - 1) // CHUNK_SIZE
+        for y in range(top, bottom + 1):
+            for x in range(left, right + 1):
+                area = world.clip(pygame.Rect(x * CHUNK_SIZE, y * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+                self.screen.blit(self.chunk((x, y)), (area.left - view.left, area.top - view.top),
+                                 area.move(-x * CHUNK_SIZE, -y * CHUNK_SIZE))
+
+    def draw(self):
+        """
+        画一帧并提交变化的矩形
+        """
+        view = self.camera.rect
+        dirty = self.rebake()
+        full = self.fullRedraw or self.lastView != view.topleft
+        if full:
+            for x, y in self.camera.visibleChunks():
+                self.screen.blit(self.chunk((x, y)), (x * CHUNK_SIZE - view.left, y * CHUNK_SIZE - view.top))
+        else:
+            # erase the moving sprites of the last frame, together with the re-baked cells
+            rects = [rect.move(-view.left, -view.top) for rect in dirty if rect.colliderect(view)]
+            rects.extend(self.lastRects)
+            for rect in rects:
+                self.restore(rect)
+
+        # the image of a turned sprite can be larger than its rect, cull with some margin
+        margin = view.inflate(100, 100)
+        blits = []
+        # same order as the groups in the map header
+        for key, group in self.gameMap.groups.items():
+            if key in TickScheduler.MOVING_GROUPS:
+                blits.extend((sprite.image, sprite.rect.move(-view.left, -view.top))
+                             for sprite in group.sprites() if margin.colliderect(sprite.rect))
+        blits.extend(self.gameMap.missiles.blits(view))
+        if self.overlay is not None:
+            blits.append((self.overlay, (0, 0)))
+        # remember the area actually drawn
+        self.lastRects = self.screen.blits(blits)
+        if profiler.enabled:
+            profiler.lap("draw")
+
+        if full:
+            pygame.display.update()
+            self.fullRedraw = False
+            self.lastView = view.topleft
+        else:
+            rects.extend(self.lastRects)
+            pygame.display.update(rects)
+        if profiler.enabled:
+            profiler.lap("present")
@@ -0,0 +1,169 @@
+import gzip
+import json
+import struct
+import zlib
+
+from Events import DIRECTION_CODES
+
+REPLAY_VERSION = 2
+# 录像里表示放出一辆敌方坦克的输入
+SPAWN = "SPAWN"
+
+TANK_STATE = struct.Struct("<iiiibb")
+
+
+class ReplayMismatch(Exception):
+    """
+    重放时某个tick的状态哈希和录像里的不一致，说明模拟不再是确定性的或者逻辑发生了变化
+    """
+
+    def __init__(self, tick: int, expected: int, actual: int):
+        super().__init__("state hash mismatch at tick {}: expected {:08x}, got {:08x}".format(tick, expected, actual))
+        self.tick = tick
+        self.expected = expected
+        self.actual = actual
+
+
+class Replay:
+    """
+    一局游戏的录像：地图、随机数种子、每个tick的玩家输入和放出敌方坦克的时机，以及每个tick结束时的状态哈希。
+    模拟是确定性的，所以只要按同样的tick给出同样的输入就能重现整局游戏
+    """
+
+    def __init__(self, mapPath: str, seed: int, tickRate=60, autoSpawn=False, enemyConfig=None, lodRadius=None,
+                 aiMaxDecisions=None, aiLodTicks=0):
+        """
+        :param mapPath: 地图路径
+        :param seed: 随机数种子
+        :param tickRate: 每秒的tick数
+        :param autoSpawn: 录制时是否按tick自动放出敌方坦克，是的话放出坦克不算输入
+        :param enemyConfig: 所有敌方坦克统一使用的配置简称，None为按地图原样
+        :param lodRadius: 录制时低精度模拟的半径（块数），None为全部完整精度
+        :param aiMaxDecisions: 录制时每个tick最多做决定的敌方坦克数，None为不限制
+        :param aiLodTicks: 录制时远处的敌方坦克每远一块增加的决定间隔（tick）
+        """
+        self.mapPath = mapPath
+        self.seed = seed
+        self.tickRate = tickRate
+        self.autoSpawn = autoSpawn
+        self.enemyConfig = enemyConfig
+        self.lodRadius = lodRadius
+        self.aiMaxDecisions = aiMaxDecisions
+        self.aiLodTicks = aiLodTicks
+        # (tick, action) in the order they were applied, the action is applied before that tick is simulated
+        self.inputs = []
+        # state hash after each tick
+        self.hashes = []
+
+    @property
+    def ticks(self):
+        return len(self.hashes)
+
+    def record(self, tick: int, action: str):
+        """
+        记录一个输入
+
+        :param tick: 输入发生时已经模拟过的tick数
+        :param action: 玩家动作或者SPAWN
+        """
+        self.inputs.append((tick, action))
+
+    def inputsByTick(self):
+        """
+        :return: tick到该tick之前的输入列表的字典
+        """
+        result = {}
+        for tick, action in self.inputs:
+            result.setdefault(tick, []).append(action)
+        return result
+
+    def save(self, path: str):
+        """
+        保存为gzip压缩的JSON，状态哈希存成一串十六进制
+        """
+        data = {
+            "version": REPLAY_VERSION,
+            "map": self.mapPath,
+            "seed": self.seed,
+            "tickRate": self.tickRate,
+            "autoSpawn": self.autoSpawn,
+            "enemyConfig": self.enemyConfig,
+            "lodRadius": self.lodRadius,
+            "aiMaxDecisions": self.aiMaxDecisions,
+            "aiLodTicks": self.aiLodTicks,
+            "inputs": self.inputs,
+            "hashes": "".join("{:08x}".format(h) for h in self.hashes),
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        读取录像文件
+
+        :param path: 录像文件路径
+        :return: Replay对象
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != REPLAY_VERSION:
+            raise ValueError("{} has an unsupported replay version {}".format(path, data.get("version")))
+        # replays recorded before the keyword was renamed store it as aiBudget
+        replay = cls(data["map"], data["seed"], data["tickRate"], data["autoSpawn"], data["enemyConfig"],
+                     data.get("lodRadius"), data.get("aiMaxDecisions", data.get("aiBudget")),
+                     data.get("aiLodTicks", 0))
+        replay.inputs = [(tick, action) for tick, action in data["inputs"]]
+        hashes = data["hashes"]
+        replay.hashes = [int(hashes[i:i + 8], 16) for i in range(0, len(hashes), 8)]
+        return replay
+
+
+def stateHash(simulation):
+    """
+    计算模拟当前状态的哈希：占用网格、所有可见坦克的位置、朝向、血量和移动状态，所有导弹，以及伤害统计
+
+    :param simulation: Simulation对象
+    :return: 32位整数
+    """
+    m = simulation.map
+    occupancy = m.occupancy
+    h = zlib.crc32(occupancy.cellType.tobytes())
+    h = zlib.crc32(occupancy.hp.tobytes(), h)
+    h = zlib.crc32(occupancy.unitId.tobytes(), h)
+    for key in ("FriendlyTank", "EnemyTank"):
+        for tank in m.groups[key]:
+            h = zlib.crc32(TANK_STATE.pack(tank.entityId, tank.rect.left, tank.rect.top, tank.hp,
+                                           DIRECTION_CODES[tank.direction], tank.moving), h)
+    missiles = m.missiles
+    slots = missiles.slots()
+    h = zlib.crc32(slots.tobytes(), h)
+    h = zlib.crc32(missiles.position[slots].tobytes(), h)
+    h = zlib.crc32(struct.pack("<qq", m.damageDealt, m.damageTaken), h)
+    return h
+
+
+if __name__ == '__main__':
+    import argparse
+    import contextlib
+    import io
+    import sys
+
+    # this file runs as __main__, use the classes of the Replay module that Engine imported
+    from Engine import runReplay, Replay, ReplayMismatch
+
+    parser = argparse.ArgumentParser(description="无窗口、不限帧率地重放录像，逐tick检查状态哈希")
+    parser.add_argument("replays", nargs="+", help="录像文件路径")
+    parser.add_argument("--no-check", dest="check", action="store_false", help="不检查状态哈希，只测速度")
+    args = parser.parse_args()
+    failed = 0
+    for path in args.replays:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = runReplay(Replay.load(path), check=args.check)
+        except ReplayMismatch as e:
+            failed += 1
+            print("{}: FAILED, {}".format(path, e))
+            continue
+        print("{}: {} in {} ticks, {:.0f} ticks/s".format(path, result.outcome, result.ticks, result.ticksPerSecond))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,184 @@
+import time
+
+from Camera import chunkOf, chunkDistance
+
+
+class TickScheduler:
+    """
+    固定步长的模拟调度器，由游戏循环持有。每个tick对所有会动的物体调用一次update方法，推进移动动画和开火冷却，
+    不再为每次移动和开火单独创建线程，所以模拟是确定性的，也不会和碰撞检测抢着改rect。
+    """
+
+    # 会动的物体所在的组
+    MOVING_GROUPS = ("EnemyTank", "FriendlyTank")
+
+    def __init__(self, gameMap, tickRate=60, maxTicksPerAdvance=5):
+        """
+        初始化调度器
+
+        :param gameMap: GameMap对象
+        :param tickRate: 每秒的tick数
+        :param maxTicksPerAdvance: 一次advance最多补跑的tick数，防止卡顿后模拟追不上
+        """
+        self.gameMap = gameMap
+        self.tickRate = tickRate
+        self.tickMs = 1000 / tickRate
+        self.maxTicksPerAdvance = maxTicksPerAdvance
+        self.accumulator = 0
+        self.ticks = 0
+
+    def tick(self):
+        """
+        推进一个tick，同一个精灵即使在多个组里也只推进一次，导弹池里的导弹一次全部推进
+        """
+        updated = set()
+        for key in self.MOVING_GROUPS:
+            group = self.gameMap.groups.get(key)
+            if group is None:
+                continue
+            for sprite in group.sprites():
+                if sprite in updated or not sprite.alive():
+                    continue
+                updated.add(sprite)
+                sprite.update(self.tickMs)
+        self.gameMap.missiles.step()
+        self.ticks += 1
+
+    def advance(self, elapsedMs: float, stepFunc=None):
+        """
+        把经过的真实时间累积起来，按固定步长推进对应数量的tick
+
+        :param elapsedMs: 距离上次调用经过的毫秒数
+        :param stepFunc: 每个tick调用的函数，默认为tick方法，Simulation会传入包含AI和碰撞检测的step方法
+        :return: 本次推进的tick数
+        """
+        if stepFunc is None:
+            stepFunc = self.tick
+        self.accumulator += elapsedMs
+        n = 0
+        while self.accumulator >= self.tickMs and n < self.maxTicksPerAdvance:
+            stepFunc()
+            self.accumulator -= self.tickMs
+            n += 1
+        if n == self.maxTicksPerAdvance:
+            # drop the backlog instead of spiralling
+            self.accumulator = min(self.accumulator, self.tickMs)
+        return n
+
+
+class AIScheduler:
+    """
+    敌方坦克AI的调度器。每个tick只让一部分停下来的坦克做决定（能打到目标时开火、寻路并移动），
+    按优先级排队：离玩家坦克或基地越近越优先，等得越久越优先，超出预算的坦克留到下一个tick；
+    离得远的坦克做完决定之后要隔几个tick才会再做决定。
+
+    maxDecisions和lodTicks只和tick有关，模拟仍然是确定性的；budgetMs按真实时间截断，
+    开启后同样的输入不一定得到同样的结果，录像时不要开启。
+    """
+
+    # 每多等一个tick，优先级相当于近了这么多格
+    AGING = 1
+
+    def __init__(self, gameMap, maxDecisions=None, budgetMs=None, lodTicks=0, nearChunks=1, maxInterval=30):
+        """
+        :param gameMap: GameMap对象
+        :param maxDecisions: 每个tick最多做决定的坦克数，None为不限制
+        :param budgetMs: 每个tick的AI时间预算（毫秒），用完就把剩下的坦克留到下一个tick，None为不限制
+        :param lodTicks: 离玩家坦克和基地超过nearChunks块之后，每远一块做决定的间隔多这么多tick，0为每个tick都可以做决定
+        :param nearChunks: 在这个块数以内的坦克每个tick都可以做决定
+        :param maxInterval: 做决定的最长间隔（tick）
+        """
+        self.gameMap = gameMap
+        self.maxDecisions = maxDecisions
+        self.budgetMs = budgetMs
+        self.lodTicks = lodTicks
+        self.nearChunks = nearChunks
+        self.maxInterval = maxInterval
+        # metrics
+        self.queueLength = 0
+        self.peakQueueLength = 0
+        self.decisions = 0
+        self.deferred = 0
+        self.overruns = 0
+        self.lastMs = 0.0
+
+    def anchors(self, player):
+        """
+        :param player: 玩家坦克
+        :return: 玩家坦克和所有基地的中心点
+        """
+        return [player.rect.center] + [base.rect.center for base in self.gameMap.groups["Base"]]
+
+    def run(self, ticks: int, player):
+        """
+        让这个tick该做决定的坦克按优先级做决定
+
+        :param ticks: 当前的tick数
+        :param player: 玩家坦克
+        :return: 这个tick做了决定的坦克数
+        """
+        m = self.gameMap
+        due = [tank for tank in m.groups["EnemyTank"] if not tank.moving and tank.nextDecision <= ticks]
+        for tank in due:
+            if tank.dueSince is None:
+                tank.dueSince = ticks
+        anchors = self.anchors(player) if self.lodTicks or self.limited else None
+        if self.limited and len(due) > 1:
+            def priority(tank):
+                x, y = tank.rect.center
+                distance = min(abs(x - ax) + abs(y - ay) for ax, ay in anchors) // 50
+                return distance - (ticks - tank.dueSince) * self.AGING, tank.entityId
+
+            due.sort(key=priority)
+
+        start = time.perf_counter()
+        n = 0
+        for tank in due:
+            if self.maxDecisions is not None and n >= self.maxDecisions:
+                break
+            if self.budgetMs is not None and n and (time.perf_counter() - start) * 1000 >= self.budgetMs:
+                break
+            if tank.shouldFire(player):
+                tank.fire(m)
+            tank.move(tank.searchPath(player), tank.speed, 50)
+            tank.dueSince = None
+            tank.nextDecision = ticks + self.interval(tank, anchors)
+            n += 1
+        self.lastMs = (time.perf_counter() - start) * 1000
+
+        self.decisions += n
+        self.queueLength = len(due) - n
+        self.deferred += self.queueLength
+        self.peakQueueLength = max(self.peakQueueLength, self.queueLength)
+        if self.budgetMs is not None and self.lastMs > self.budgetMs:
+            self.overruns += 1
+        return n
+
+    @property
+    def limited(self):
+        return self.maxDecisions is not None or self.budgetMs is not None
+
+    def interval(self, tank, anchors):
+        """
+        :param tank: 刚做完决定的坦克
+        :param anchors: 玩家坦克和基地的中心点
+        :return: 到下次做决定要等的tick数
+        """
+        if not self.lodTicks:
+            return 0
+        chunk = chunkOf(*tank.rect.center)
+        distance = min(chunkDistance(chunk, chunkOf(*anchor)) for anchor in anchors)
+        return min(self.maxInterval, max(0, distance - self.nearChunks) * self.lodTicks)
+
+    def metrics(self):
+        """
+        :return: 排队长度、排队长度的峰值、做过的决定数、被推迟的次数、超出时间预算的tick数和上个tick的AI耗时（毫秒）
+        """
+        return {
+            "queueLength": self.queueLength,
+            "peakQueueLength": self.peakQueueLength,
+            "decisions": self.decisions,
+            "deferred": self.deferred,
+            "overruns": self.overruns,
+            "lastMs": self.lastMs,
+        }
@@ -0,0 +1,506 @@
+"""
+权威游戏服务器。服务器按固定的tick推进模拟，客户端只发送输入、接收状态。
+
+协议：每条消息是一个MESSAGE头（负载长度、消息类型）加上负载，都是小端序。
+客户端连接后先发HELLO，服务器回WELCOME，告诉它控制第几辆友方坦克（-1为旁观）和差量最多基于多少个tick之前的状态；之后客户端随时发INPUT，
+收到STATE后回ACK。服务器每个tick给每个客户端发一条STATE，内容是这个tick的状态和这个客户端最后确认的状态逐字节异或之后
+再用zlib压缩的结果（状态大部分不变，异或之后几乎全是0），确认的状态太旧或者布局变了时发完整的关键帧。
+STATE里带着状态的CRC32，客户端还原之后可以校验；还带着服务器处理过的这个客户端最后一条输入的序号，客户端据此测量输入延迟。
+
+用法：python Server.py level1.map [--port 7777 | --unix 路径]
+      python Server.py level1.map --loopback 2 [--ticks 600]    在本进程里起服务器和若干个随机输入的测试客户端
+"""
+import asyncio
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from Engine import Simulation, WIN, LOSE
+from Events import DIRECTION_CODES
+from VectorEnv import ACTIONS
+
+MESSAGE = struct.Struct("<IB")
+# 消息类型
+HELLO = 1
+WELCOME = 2
+INPUT = 3
+ACK = 4
+STATE = 5
+# 消息负载的固定部分
+WELCOME_BODY = struct.Struct("<bHIIIH")
+INPUT_BODY = struct.Struct("<IB")
+ACK_BODY = struct.Struct("<I")
+STATE_BODY = struct.Struct("<IIIIB")
+# STATE里表示关键帧的基准tick
+KEYFRAME = 0xFFFFFFFF
+OUTCOME_CODES = {None: 0, WIN: 1, LOSE: 2}
+OUTCOMES = {code: outcome for outcome, code in OUTCOME_CODES.items()}
+
+# 网络状态里每个实体和每个导弹槽位的布局
+ENTITY_VIEW = np.dtype([("x", "<i4"), ("y", "<i4"), ("hp", "<i4"), ("direction", "i1"), ("flags", "u1")])
+MISSILE_VIEW = np.dtype([("x", "<i4"), ("y", "<i4"), ("direction", "i1"), ("alive", "?")])
+# flags的位
+ALIVE = 1
+INVISIBLE = 2
+
+
+def encodeState(simulation):
+    """
+    把客户端需要显示的状态编码成布局固定的字节串：静态层的格子类型和血量、每个实体的位置血量朝向、导弹池的每个槽位。
+    布局固定，所以相邻两个tick的字节串逐字节异或之后只有变化的地方不是0
+
+    :param simulation: Simulation对象
+    :return: bytes
+    """
+    m = simulation.map
+    occupancy = m.occupancy
+    entities = np.array([(item.rect.left, item.rect.top, item.hp, DIRECTION_CODES[item.direction],
+                          (ALIVE if item.alive() else 0) | (INVISIBLE if item.invisible else 0))
+                         for item in occupancy.registry.values()], ENTITY_VIEW)
+    missiles = np.zeros(m.missiles.capacity, MISSILE_VIEW)
+    missiles["alive"] = m.missiles.alive
+    missiles["x"], missiles["y"] = m.missiles.position[:, 0], m.missiles.position[:, 1]
+    missiles["direction"] = m.missiles.direction
+    return b"".join((occupancy.cellType.tobytes(), occupancy.hp.tobytes(), entities.tobytes(), missiles.tobytes()))
+
+
+def decodeState(state: bytes, width: int, height: int, entityCount: int):
+    """
+    把encodeState的结果拆开
+
+    :return: (格子类型[x, y], 血量[x, y], 实体数组, 导弹数组)
+    """
+    cells = width * height
+    cellType = np.frombuffer(state, np.int8, cells).reshape(width, height)
+    hp = np.frombuffer(state, np.int32, cells, cells).reshape(width, height)
+    offset = cells * 5
+    entities = np.frombuffer(state, ENTITY_VIEW, entityCount, offset)
+    offset += entityCount * ENTITY_VIEW.itemsize
+    missiles = np.frombuffer(state, MISSILE_VIEW, (len(state) - offset) // MISSILE_VIEW.itemsize, offset)
+    return cellType, hp, entities, missiles
+
+
+def xor(a: bytes, b: bytes):
+    return np.bitwise_xor(np.frombuffer(a, np.uint8), np.frombuffer(b, np.uint8)).tobytes()
+
+
+async def readMessage(reader, limit=None):
+    """
+    :param limit: 负载的最大字节数，超过时当作连接关闭，None为不限制
+    :return: (消息类型, 负载)，连接关闭时为(None, None)
+    """
+    try:
+        length, kind = MESSAGE.unpack(await reader.readexactly(MESSAGE.size))
+        if limit is not None and length > limit:
+            return None, None
+        return kind, await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None, None
+
+
+def writeMessage(writer, kind: int, payload: bytes):
+    writer.write(MESSAGE.pack(len(payload), kind) + payload)
+
+
+class Session:
+    """
+    服务器上的一个客户端连接
+    """
+
+    def __init__(self, writer, name: str, tank, index: int):
+        """
+        :param writer: asyncio的StreamWriter
+        :param name: 客户端的名字
+        :param tank: 这个客户端控制的友方坦克，None为旁观
+        :param index: 控制的坦克在FriendlyTank组里的下标，-1为旁观
+        """
+        self.writer = writer
+        self.name = name
+        self.tank = tank
+        self.index = index
+        # (seq, action) received since the last tick
+        self.inputs = []
+        self.lastInputSeq = 0
+        self.ackedTick = None
+        # tick -> state sent to this client in the last historyTicks ticks, not acknowledged yet or the acknowledged one
+        self.history = {}
+
+
+class GameServer:
+    """
+    权威服务器，只有它推进模拟，客户端的输入在下一个tick开始时按收到的顺序执行
+    """
+
+    # 发送缓冲超过这么多字节的客户端这个tick不发，等它跟上之后再按它确认的状态发差量
+    MAX_BUFFERED = 1 << 16
+    # 客户端发来的消息负载的最大字节数，更长的直接断开连接
+    MAX_PAYLOAD = 1 << 10
+    # 一个客户端在一个tick里最多排队的输入数，多出来的丢掉
+    MAX_INPUTS = 16
+
+    def __init__(self, mapPath: str, seed=0, tickRate=60, historyTicks=120):
+        """
+        :param mapPath: 地图路径
+        :param seed: 随机数种子
+        :param tickRate: 每秒的tick数
+        :param historyTicks: 为每个客户端保留的已发送状态的tick数，确认的状态比这更旧时发关键帧
+        """
+        self.simulation = Simulation(mapPath, seed=seed, tickRate=tickRate, autoSpawn=True)
+        self.mapPath = mapPath
+        self.historyTicks = historyTicks
+        self.sessions = []
+        self.handlers = set()
+        self.server = None
+        self.finished = asyncio.Event()
+        # metrics
+        self.bytesSent = 0
+        self.statesSent = 0
+        self.keyframes = 0
+        self.skipped = 0
+        # client messages that were malformed or over MAX_INPUTS and got dropped
+        self.rejected = 0
+        self.tickTimes = []
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """
+        开始监听
+
+        :param host: TCP地址
+        :param port: TCP端口，0为随便选一个
+        :param path: UNIX套接字路径，给出时不监听TCP
+        :return: 实际监听的地址
+        """
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+            return path
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    def freeTank(self):
+        """
+        :return: (还没有人控制的友方坦克, 它的下标)，都被占了时为(None, -1)
+        """
+        taken = {session.tank for session in self.sessions}
+        for index, tank in enumerate(self.simulation.map.groups["FriendlyTank"].sprites()):
+            if tank not in taken:
+                return tank, index
+        return None, -1
+
+    async def handle(self, reader, writer):
+        """
+        一个客户端连接的处理协程，连接断开或者服务器关闭时结束
+        """
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            await self.serve(reader, writer)
+        finally:
+            self.handlers.discard(task)
+            writer.close()
+
+    async def serve(self, reader, writer):
+        """
+        握手之后不停地读输入和确认
+        """
+        kind, payload = await readMessage(reader, self.MAX_PAYLOAD)
+        if kind != HELLO:
+            return
+        tank, index = self.freeTank()
+        session = Session(writer, payload.decode("utf-8", "replace"), tank, index)
+        occupancy = self.simulation.map.occupancy
+        writeMessage(writer, WELCOME, WELCOME_BODY.pack(index, self.simulation.scheduler.tickRate, occupancy.width,
+                                                        occupancy.height, len(occupancy.registry), self.historyTicks)
+                     + self.mapPath.encode("utf-8"))
+        self.sessions.append(session)
+        try:
+            while True:
+                kind, payload = await readMessage(reader, self.MAX_PAYLOAD)
+                if kind is None:
+                    break
+                # anything a client sends is checked here, a bad message must not reach the simulation
+                if kind == INPUT and len(payload) == INPUT_BODY.size:
+                    seq, action = INPUT_BODY.unpack(payload)
+                    if action < len(ACTIONS) and len(session.inputs) < self.MAX_INPUTS:
+                        session.inputs.append((seq, action))
+                    else:
+                        self.rejected += 1
+                elif kind == ACK and len(payload) == ACK_BODY.size:
+                    tick, = ACK_BODY.unpack(payload)
+                    if tick in session.history and (session.ackedTick is None or tick > session.ackedTick):
+                        session.ackedTick = tick
+                        for old in [t for t in session.history if t < tick]:
+                            del session.history[old]
+                else:
+                    self.rejected += 1
+        finally:
+            self.sessions.remove(session)
+
+    def tick(self):
+        """
+        执行收到的输入，推进一个tick，然后给每个客户端发状态
+        """
+        simulation = self.simulation
+        for session in self.sessions:
+            for seq, action in session.inputs:
+                if session.tank is not None and session.tank.alive():
+                    simulation.applyAction(ACTIONS[action], session.tank)
+                session.lastInputSeq = seq
+            session.inputs.clear()
+        simulation.step()
+        ticks = simulation.scheduler.ticks
+        state = encodeState(simulation)
+        crc = zlib.crc32(state)
+        outcome = OUTCOME_CODES[simulation.outcome]
+        for session in self.sessions:
+            transport = session.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.MAX_BUFFERED and simulation.outcome is None:
+                self.skipped += 1
+                continue
+            base = session.history.get(session.ackedTick)
+            if base is not None and len(base) == len(state) and ticks - session.ackedTick <= self.historyTicks:
+                baseTick, body = session.ackedTick, zlib.compress(xor(state, base), 1)
+            else:
+                baseTick, body = KEYFRAME, zlib.compress(state, 1)
+                self.keyframes += 1
+            payload = STATE_BODY.pack(ticks, baseTick, session.lastInputSeq, crc, outcome) + body
+            writeMessage(session.writer, STATE, payload)
+            session.history[ticks] = state
+            # a client that stops acknowledging must not make the history grow, its next state is a keyframe anyway
+            for old in [t for t in session.history if t < ticks - self.historyTicks]:
+                del session.history[old]
+            self.bytesSent += MESSAGE.size + len(payload)
+            self.statesSent += 1
+
+    async def run(self, tickLimit=None):
+        """
+        按固定步长推进模拟，直到分出胜负或者到达tickLimit
+
+        :param tickLimit: 最多的tick数，None为不限制
+        """
+        loop = asyncio.get_running_loop()
+        tickSeconds = 1 / self.simulation.scheduler.tickRate
+        deadline = loop.time()
+        while self.simulation.outcome is None and (tickLimit is None or self.simulation.scheduler.ticks < tickLimit):
+            start = time.perf_counter()
+            self.tick()
+            self.tickTimes.append(time.perf_counter() - start)
+            deadline += tickSeconds
+            delay = deadline - loop.time()
+            if delay < -tickSeconds * self.simulation.scheduler.maxTicksPerAdvance:
+                # fell too far behind, drop the backlog like TickScheduler.advance does
+                deadline = loop.time()
+            await asyncio.sleep(max(delay, 0))
+        self.finished.set()
+
+    async def close(self):
+        for session in list(self.sessions):
+            session.writer.close()
+        # closing the transports ends the handlers with EOF instead of leaving them to be cancelled
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def report(self):
+        """
+        :return: 一行统计：tick数、每个客户端每个tick的平均字节数、关键帧数、丢掉的消息数和每个tick的平均耗时
+        """
+        ticks = self.simulation.scheduler.ticks
+        return "{} ticks, {:.1f} bytes/tick per client, {} states, {} keyframes, {} skipped, {} rejected, " \
+               "{:.2f} ms/tick".format(ticks, self.bytesSent / self.statesSent if self.statesSent else 0.0,
+                                       self.statesSent, self.keyframes, self.skipped, self.rejected,
+                                       sum(self.tickTimes) / len(self.tickTimes) * 1000 if self.tickTimes else 0.0)
+
+
+class GameClient:
+    """
+    客户端：发送输入，接收状态并用确认过的状态还原差量，测量输入延迟
+    """
+
+    def __init__(self, name="client"):
+        self.name = name
+        self.reader = None
+        self.writer = None
+        self.index = -1
+        self.tickRate = 60
+        self.width = self.height = self.entityCount = 0
+        self.historyTicks = 0
+        self.mapPath = None
+        # tick -> decoded state bytes that the server may still use as a delta base
+        self.states = {}
+        self.tick = None
+        self.outcome = None
+        self.nextSeq = 1
+        # seq -> time the input was sent
+        self.pending = {}
+        self.latencies = []
+        self.bytesReceived = 0
+        self.crcErrors = 0
+
+    async def connect(self, host="127.0.0.1", port=None, path=None):
+        """
+        连接服务器并握手
+
+        :param path: UNIX套接字路径，给出时不用TCP
+        """
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        writeMessage(self.writer, HELLO, self.name.encode("utf-8"))
+        kind, payload = await readMessage(self.reader)
+        if kind != WELCOME:
+            raise ConnectionError("expected WELCOME, got {}".format(kind))
+        (self.index, self.tickRate, self.width, self.height, self.entityCount,
+         self.historyTicks) = WELCOME_BODY.unpack_from(payload)
+        self.mapPath = payload[WELCOME_BODY.size:].decode("utf-8")
+
+    def send(self, action):
+        """
+        发送一个动作
+
+        :param action: ACTIONS里的动作
+        :return: 这条输入的序号
+        """
+        seq = self.nextSeq
+        self.nextSeq += 1
+        self.pending[seq] = time.perf_counter()
+        writeMessage(self.writer, INPUT, INPUT_BODY.pack(seq, ACTIONS.index(action)))
+        return seq
+
+    async def receive(self):
+        """
+        接收状态直到连接关闭或者分出胜负
+        """
+        while True:
+            kind, payload = await readMessage(self.reader)
+            if kind is None:
+                return
+            if kind != STATE:
+                continue
+            now = time.perf_counter()
+            self.bytesReceived += MESSAGE.size + len(payload)
+            tick, baseTick, lastInputSeq, crc, outcome = STATE_BODY.unpack_from(payload)
+            body = zlib.decompress(payload[STATE_BODY.size:])
+            if baseTick == KEYFRAME:
+                state = body
+            else:
+                base = self.states.get(baseTick)
+                if base is None:
+                    # the server only uses acknowledged states, so this cannot happen
+                    raise ConnectionError("missing base state {}".format(baseTick))
+                state = xor(body, base)
+            if zlib.crc32(state) != crc:
+                self.crcErrors += 1
+                continue
+            for seq in [s for s in self.pending if s <= lastInputSeq]:
+                self.latencies.append(now - self.pending.pop(seq))
+            # the server deltas against the newest tick it has seen acknowledged, which never goes backwards,
+            # and never against one more than historyTicks old, so a client that only gets keyframes stays bounded too
+            self.states[tick] = state
+            oldest = tick - self.historyTicks if baseTick == KEYFRAME else max(baseTick, tick - self.historyTicks)
+            for old in [t for t in self.states if t < oldest]:
+                del self.states[old]
+            self.tick = tick
+            self.outcome = OUTCOMES[outcome]
+            writeMessage(self.writer, ACK, ACK_BODY.pack(tick))
+            if self.outcome is not None:
+                return
+
+    def decoded(self):
+        """
+        :return: 最新状态的decodeState结果
+        """
+        return decodeState(self.states[self.tick], self.width, self.height, self.entityCount)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def loopback(mapPath: str, clients=2, ticks=600, seed=0, path=None, tickRate=60):
+    """
+    在本进程里起服务器和若干个测试客户端，客户端每隔几个tick随机发一个动作，跑完之后输出带宽和延迟的统计
+
+    :param mapPath: 地图路径
+    :param clients: 客户端数量
+    :param ticks: 跑多少个tick
+    :param path: UNIX套接字路径，None为用TCP
+    :return: (服务器, 客户端列表)
+    """
+    import random
+
+    server = GameServer(mapPath, seed=seed, tickRate=tickRate)
+    address = await server.start(path=path)
+    bots = [GameClient("bot{}".format(i)) for i in range(clients)]
+    for bot in bots:
+        if path is not None:
+            await bot.connect(path=address)
+        else:
+            await bot.connect(*address)
+    rng = random.Random(seed)
+
+    async def play(bot):
+        while not server.finished.is_set():
+            bot.send(rng.choice(ACTIONS[1:]))
+            await asyncio.sleep(rng.uniform(2, 10) / tickRate)
+
+    receivers = [asyncio.ensure_future(bot.receive()) for bot in bots]
+    players = [asyncio.ensure_future(play(bot)) for bot in bots]
+    await server.run(ticks)
+    # let the last states arrive
+    await asyncio.wait(receivers, timeout=1)
+    for task in players + receivers:
+        task.cancel()
+    for task in receivers:
+        if task.done() and not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    for bot in bots:
+        bot.close()
+    await server.close()
+    return server, bots
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="权威游戏服务器")
+    parser.add_argument("map", help="地图路径")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP地址")
+    parser.add_argument("--port", type=int, default=7777, help="TCP端口")
+    parser.add_argument("--unix", help="UNIX套接字路径，给出时不监听TCP")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--loopback", type=int, metavar="N", help="不对外监听，在本进程里用N个测试客户端跑一局")
+    parser.add_argument("--ticks", type=int, default=600, help="回环测试跑的tick数")
+    args = parser.parse_args()
+
+    if args.loopback:
+        server, bots = asyncio.run(loopback(args.map, args.loopback, args.ticks, args.seed, args.unix))
+        print(server.report())
+        failed = False
+        for bot in bots:
+            latencies = sorted(bot.latencies)
+            print("{} (tank {}): {:.1f} bytes/tick received, {} inputs, latency p50 {:.1f} ms p99 {:.1f} ms, "
+                  "{} crc errors".format(bot.name, bot.index, bot.bytesReceived / max(bot.tick or 1, 1),
+                                         len(latencies),
+                                         latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+                                         latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+                                         bot.crcErrors))
+            # the newest state a client has must be exactly what the server sent for that tick
+            failed |= bot.crcErrors > 0 or bot.tick is None
+        sys.exit(1 if failed else 0)
+
+    async def serve():
+        server = GameServer(args.map, seed=args.seed)
+        address = await server.start(args.host, args.port, args.unix)
+        print("Serving {} on {}".format(args.map, address))
+        await server.run()
+        print(server.report())
+        await server.close()
+
+    asyncio.run(serve())
@@ -0,0 +1,255 @@
+import struct
+import zlib
+
+import numpy as np
+
+from Events import DIRECTION_CODES
+
+# 快照：文件头、随机数状态、占用网格的五个数组、每个精灵组的成员、每个实体一条定长记录、存活的导弹和导弹池的空闲栈，
+# 都是小端序的原始字节
+SNAPSHOT_MAGIC = b"TKSN"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<4sHIIIqdIqq8sIIII")
+# version and gauss_next of random.Random.getstate(), followed by 625 words
+RANDOM_HEADER = struct.Struct("<i?d")
+ENTITY = np.dtype([("id", "<i4"), ("listed", "?"), ("hp", "<i4"), ("x", "<i4"), ("y", "<i4"),
+                   ("direction", "i1"), ("moving", "?"), ("moveDirection", "i1"), ("moveSpeed", "<f8"),
+                   ("hasDestination", "?"), ("destX", "<i4"), ("destY", "<i4"), ("moveRemaining", "<f8"),
+                   ("moveArrived", "?"), ("lastX", "<i4"), ("lastY", "<i4"), ("invisible", "?"),
+                   ("lowFidelity", "?"), ("invincible", "?"), ("firing", "?"), ("fireCooldown", "<f8"),
+                   ("stuckNum", "<i4"), ("nextDecision", "<i8"), ("dueSince", "<i8"), ("unitX", "<i4"),
+                   ("unitY", "<i4")])
+MISSILE = np.dtype([("slot", "<i4"), ("x", "<i4"), ("y", "<i4"), ("vx", "<i4"), ("vy", "<i4"), ("direction", "i1"),
+                    ("owner", "<i4"), ("damage", "<i4"), ("hp", "<i4")])
+# 占用网格里保存的数组，按这个顺序
+GRIDS = ("cellType", "entityId", "hp", "unitType", "unitId")
+DIRECTIONS = tuple(DIRECTION_CODES)
+
+
+def number(value: float):
+    """
+    :return: 是整数的浮点数还原成int，和模拟里的类型保持一致
+    """
+    return int(value) if value.is_integer() else value
+
+
+class SnapshotError(ValueError):
+    """
+    快照损坏，或者和要恢复到的地图不匹配
+    """
+
+
+def capture(simulation):
+    """
+    把一局游戏的全部模拟状态写成一段二进制数据，不包含图片等可以从地图文件重新得到的东西
+
+    :param simulation: Simulation对象
+    :return: bytes
+    """
+    m = simulation.map
+    occupancy = m.occupancy
+    registry = occupancy.registry
+    # member count of every group followed by the entity ids in iteration order, which the simulation depends on
+    members = []
+    for group in m.groups.values():
+        members.append(len(group))
+        members.extend(sprite.entityId for sprite in group.sprites())
+
+    # plain tuples in ENTITY field order, filling a structured array field by field is much slower
+    records = []
+    for entityId, item in registry.items():
+        destination = item.moveDestination
+        dueSince = getattr(item, "dueSince", None)
+        records.append((entityId, entityId in occupancy.entities, item.hp, item.rect.left, item.rect.top,
+                        DIRECTION_CODES[item.direction], item.moving, DIRECTION_CODES[item.moveDirection],
+                        item.moveSpeed, destination is not None, *(destination or (0, 0)), item.moveRemaining,
+                        item.moveArrived, *item.lastStep, item.invisible, item.lowFidelity, item.invincible,
+                        getattr(item, "firing", False), getattr(item, "fireCooldown", 0),
+                        getattr(item, "stuckNum", 0), getattr(item, "nextDecision", 0),
+                        -1 if dueSince is None else dueSince, *occupancy.unitCells.get(entityId, (-1, -1))))
+    entities = np.array(records, ENTITY)
+
+    missiles = m.missiles
+    slots = missiles.slots()
+    live = np.zeros(len(slots), MISSILE)
+    live["slot"] = slots
+    live["x"], live["y"] = missiles.position[slots, 0], missiles.position[slots, 1]
+    live["vx"], live["vy"] = missiles.velocity[slots, 0], missiles.velocity[slots, 1]
+    live["direction"] = missiles.direction[slots]
+    live["owner"] = missiles.owner[slots]
+    live["damage"] = missiles.damage[slots]
+    live["hp"] = missiles.hp[slots]
+
+    version, words, gauss = m.random.getstate()
+    parts = [
+        HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, occupancy.width, occupancy.height, len(registry),
+                    simulation.scheduler.ticks, simulation.scheduler.accumulator, simulation.spawnIndex,
+                    m.damageDealt, m.damageTaken, (simulation.outcome or "").encode(), missiles.capacity,
+                    len(members), len(slots), len(missiles.free)),
+        RANDOM_HEADER.pack(version, gauss is not None, gauss or 0.0),
+        np.array(words, "<u4").tobytes(),
+    ]
+    parts += [getattr(occupancy, name).tobytes() for name in GRIDS]
+    parts += [np.array(members, "<i4").tobytes(), entities.tobytes(), live.tobytes(),
+              np.array(missiles.free, "<i4").tobytes()]
+    return b"".join(parts)
+
+
+def restore(simulation, blob: bytes):
+    """
+    把capture得到的数据恢复到一局从同一张地图加载的游戏里，可以是原来那一局，也可以是另一个Simulation对象。
+    寻路距离场和视线索引会在下次用到时重新计算，状态变化的格子标记为脏，渲染器会重新烘焙
+
+    :param simulation: Simulation对象
+    :param blob: capture的返回值
+    :raises SnapshotError: 数据损坏或者地图不匹配
+    """
+    m = simulation.map
+    occupancy = m.occupancy
+    registry = occupancy.registry
+    try:
+        (magic, version, width, height, entityCount, ticks, accumulator, spawnIndex, damageDealt, damageTaken,
+         outcome, capacity, memberCount, missileCount, freeCount) = HEADER.unpack_from(blob)
+    except struct.error as e:
+        raise SnapshotError("snapshot is truncated") from e
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise SnapshotError("not a version {} snapshot".format(SNAPSHOT_VERSION))
+    if (width, height, entityCount) != (occupancy.width, occupancy.height, len(registry)):
+        raise SnapshotError("snapshot of a {}x{} map with {} entities does not fit {}x{} with {}".format(
+            width, height, entityCount, occupancy.width, occupancy.height, len(registry)))
+    cells = width * height
+    sizes = [RANDOM_HEADER.size, 625 * 4] + [cells * getattr(occupancy, name).itemsize for name in GRIDS] + \
+            [memberCount * 4, entityCount * ENTITY.itemsize, missileCount * MISSILE.itemsize, freeCount * 4]
+    if len(blob) != HEADER.size + sum(sizes):
+        raise SnapshotError("snapshot has {} bytes, expected {}".format(len(blob), HEADER.size + sum(sizes)))
+    offsets = np.cumsum([HEADER.size] + sizes)
+
+    # check everything a corrupt snapshot could get wrong before the simulation is touched
+    members = np.frombuffer(blob, "<i4", memberCount, offsets[2 + len(GRIDS)]).tolist()
+    memberships = []
+    start = 0
+    for group in m.groups.values():
+        count = members[start] if start < len(members) else -1
+        ids = members[start + 1:start + 1 + count]
+        if count < 0 or len(ids) != count or not registry.keys() >= set(ids):
+            raise SnapshotError("group membership is corrupt")
+        memberships.append((group, ids))
+        start += 1 + count
+    entities = np.frombuffer(blob, ENTITY, entityCount, offsets[3 + len(GRIDS)])
+    live = np.frombuffer(blob, MISSILE, missileCount, offsets[4 + len(GRIDS)])
+    free = np.frombuffer(blob, "<i4", freeCount, offsets[5 + len(GRIDS)])
+    directions = np.concatenate((entities["direction"], entities["moveDirection"], live["direction"]))
+    # every slot of the pool is either live or on the free stack
+    if (capacity != missileCount + freeCount or not registry.keys() >= set(entities["id"].tolist())
+            or ((directions < 0) | (directions >= len(DIRECTIONS))).any()
+            or ((live["slot"] < 0) | (live["slot"] >= capacity)).any() or ((free < 0) | (free >= capacity)).any()):
+        raise SnapshotError("entity or missile records are corrupt")
+    randomVersion, hasGauss, gauss = RANDOM_HEADER.unpack_from(blob, offsets[0])
+    words = np.frombuffer(blob, "<u4", 625, offsets[1])
+    try:
+        m.random.setstate((randomVersion, tuple(words.tolist()), gauss if hasGauss else None))
+    except (ValueError, TypeError) as e:
+        raise SnapshotError("random state is corrupt") from e
+
+    # remember what the static layer looked like, changed cells need to be re-baked
+    oldCellType, oldHp = occupancy.cellType.copy(), occupancy.hp.copy()
+    for i, name in enumerate(GRIDS):
+        grid = getattr(occupancy, name)
+        grid[...] = np.frombuffer(blob, grid.dtype, cells, offsets[2 + i]).reshape(grid.shape)
+    for x, y in np.argwhere((oldCellType != occupancy.cellType) | (oldHp != occupancy.hp)):
+        m.dirtyCells.add((int(x), int(y)))
+
+    for group, ids in memberships:
+        if [sprite.entityId for sprite in group.sprites()] != ids:
+            group.empty()
+            group.add(*(registry[entityId] for entityId in ids))
+
+    occupancy.entities = {}
+    occupancy.unitCells = {}
+    for (entityId, listed, hp, x, y, direction, moving, moveDirection, moveSpeed, hasDestination, destX, destY,
+         moveRemaining, moveArrived, lastX, lastY, invisible, lowFidelity, invincible, firing, fireCooldown,
+         stuckNum, nextDecision, dueSince, unitX, unitY) in entities.tolist():
+        item = registry[entityId]
+        if listed:
+            occupancy.entities[entityId] = item
+        if unitX >= 0:
+            occupancy.unitCells[entityId] = (unitX, unitY)
+        item.hp = hp
+        item.rect.topleft = (x, y)
+        item.turn(DIRECTIONS[direction])
+        item.moving = moving
+        item.moveDirection = DIRECTIONS[moveDirection]
+        item.moveSpeed = number(moveSpeed)
+        item.moveDestination = (destX, destY) if hasDestination else None
+        item.moveRemaining = number(moveRemaining)
+        item.moveArrived = moveArrived
+        item.lastStep = (lastX, lastY)
+        item.invisible = invisible
+        item.lowFidelity = lowFidelity
+        item.invincible = invincible
+        if hasattr(item, "firing"):
+            item.firing = firing
+            item.fireCooldown = number(fireCooldown)
+        if hasattr(item, "stuckNum"):
+            item.stuckNum = stuckNum
+            item.nextDecision = nextDecision
+            item.dueSince = None if dueSince < 0 else dueSince
+        if item.alive():
+            m.spatialHash.update(item)
+        else:
+            m.spatialHash.remove(item)
+
+    missiles = m.missiles
+    if missiles.capacity < capacity:
+        missiles.grow(capacity)
+    slots = live["slot"]
+    missiles.alive[:] = False
+    missiles.hp[:] = 0
+    missiles.alive[slots] = True
+    missiles.position[slots, 0], missiles.position[slots, 1] = live["x"], live["y"]
+    missiles.velocity[slots, 0], missiles.velocity[slots, 1] = live["vx"], live["vy"]
+    missiles.direction[slots] = live["direction"]
+    missiles.owner[slots] = live["owner"]
+    missiles.damage[slots] = live["damage"]
+    missiles.hp[slots] = live["hp"]
+    missiles.free = free.tolist()
+    # a pool that had grown larger than the snapshot's keeps its extra slots free
+    missiles.free[:0] = range(missiles.capacity - 1, capacity - 1, -1)
+    missiles.count = missileCount
+
+    m.navigator.costs = None
+    m.navigator.fields.clear()
+    m.sight.blocked = None
+    m.damageDealt, m.damageTaken = damageDealt, damageTaken
+    simulation.scheduler.ticks = ticks
+    simulation.scheduler.accumulator = accumulator
+    simulation.spawnIndex = spawnIndex
+    simulation.outcome = outcome.rstrip(b"\0").decode() or None
+
+
+def save(simulation, path: str):
+    """
+    把快照压缩后写进文件
+
+    :param simulation: Simulation对象
+    :param path: 文件路径
+    """
+    with open(path, "wb") as f:
+        f.write(zlib.compress(capture(simulation)))
+
+
+def load(simulation, path: str):
+    """
+    从文件读取快照并恢复
+
+    :param simulation: 从同一张地图加载的Simulation对象
+    :param path: 文件路径
+    :raises SnapshotError: 文件不是压缩过的快照、已经损坏或者和地图不匹配
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        blob = zlib.decompress(data)
+    except zlib.error as e:
+        raise SnapshotError("{} is not a compressed snapshot: {}".format(path, e)) from e
+    restore(simulation, blob)
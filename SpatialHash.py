@@ -0,0 +1,124 @@
+import pygame
+
+
+class SpatialHash:
+    """
+    空间哈希类，按照地图方格（默认50*50）对精灵进行分桶，用于碰撞检测的粗筛阶段。
+    精灵会被放进它的rect覆盖到的所有格子里，查询时只返回同格及相邻格子里的精灵，
+    这样只有候选对才需要做collide_mask的精确检测。
+    """
+
+    def __init__(self, cellSize=50):
+        """
+        初始化空间哈希
+
+        :param cellSize: 格子大小，与GameMap的方格大小一致
+        """
+        self.cellSize = cellSize
+        # (x, y) -> set of sprites
+        self.cells = {}
+        # sprite -> tuple of cells it is stored in
+        self.spriteCells = {}
+        # 本帧测试过的候选对数量，以及上一帧的数量
+        self.pairsTested = 0
+        self.lastPairsTested = 0
+
+    def cellsOf(self, rect):
+        """
+        计算rect覆盖到的所有格子
+
+        :param rect: pygame.Rect对象
+        :return: 格子坐标的元组
+        """
+        size = self.cellSize
+        left = rect.left // size
+        right = (rect.right - 1) // size
+        top = rect.top // size
+        bottom = (rect.bottom - 1) // size
+        return tuple((x, y) for x in range(left, right + 1) for y in range(top, bottom + 1))
+
+    def insert(self, sprite):
+        """
+        把精灵放入哈希表，如果已经存在则更新其所在格子
+
+        :param sprite: 精灵对象
+        """
+        self.update(sprite)
+
+    def remove(self, sprite):
+        """
+        从哈希表中移除精灵
+
+        :param sprite: 精灵对象
+        """
+        for cell in self.spriteCells.pop(sprite, ()):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(sprite)
+                if not bucket:
+                    del self.cells[cell]
+
+    def update(self, sprite):
+        """
+        精灵移动后调用，只有所在格子发生变化时才会修改哈希表
+
+        :param sprite: 精灵对象
+        """
+        newCells = self.cellsOf(sprite.rect)
+        oldCells = self.spriteCells.get(sprite)
+        if oldCells == newCells:
+            return
+        if oldCells is not None:
+            self.remove(sprite)
+        for cell in newCells:
+            self.cells.setdefault(cell, set()).add(sprite)
+        self.spriteCells[sprite] = newCells
+
+    def query(self, sprite):
+        """
+        查询与精灵处在同格或相邻格子的其他精灵，已经被kill的精灵会被顺便清除掉。
+        每返回一个候选精灵，计数器加一
+
+        :param sprite: 精灵对象
+        :return: 候选精灵的集合，不包含自身
+        """
+        size = self.cellSize
+        rect = sprite.rect
+        candidates = set()
+        for x in range(rect.left // size - 1, (rect.right - 1) // size + 2):
+            for y in range(rect.top // size - 1, (rect.bottom - 1) // size + 2):
+                bucket = self.cells.get((x, y))
+                if bucket:
+                    candidates.update(bucket)
+        candidates.discard(sprite)
+        dead = [item for item in candidates if not item.alive()]
+        for item in dead:
+            self.remove(item)
+            candidates.discard(item)
+        self.pairsTested += len(candidates)
+        return candidates
+
+    def nextFrame(self):
+        """
+        每帧结束时调用，保存本帧测试过的候选对数量并清零计数器
+
+        :return: 本帧测试过的候选对数量
+        """
+        self.lastPairsTested = self.pairsTested
+        self.pairsTested = 0
+        return self.lastPairsTested
+
+
+def collide(a, b):
+    """
+    精确碰撞检测，先用mask覆盖的矩形是否相交做廉价的预判，相交了才用物体自带的mask做逐像素检测。
+    转过向的导弹图片比它的rect大，所以这里用mask的尺寸而不是rect的尺寸
+
+    :param a: 精灵对象
+    :param b: 精灵对象
+    :return: 是否碰撞
+    """
+    if not pygame.Rect(a.rect.topleft, a.mask.get_size()).colliderect(
+            pygame.Rect(b.rect.topleft, b.mask.get_size())):
+        return False
+    return pygame.sprite.collide_mask(a, b) is not None
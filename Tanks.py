@@ -1,8 +1,8 @@
-import random
-import time
-import pygame
-import threading
-from Items import BaseItem, Missal
+from Events import events, FIRE, DIRECTION_CODES
+from Items import BaseItem
+from Layers import TEAM_PLAYER, TEAM_ENEMY, LAYER_TANK
+from Navigation import cellOf, OFFSETS
+from Occupancy import WALL, FRIENDLY_TANK, ENEMY_TANK
 
 
 class Tank(BaseItem):
@@ -10,47 +10,51 @@ class Tank(BaseItem):
     坦克类，描述了一个坦克的基本信息，继承自基本物品类，除了基础的参数之外，加入了开火方法。
     """
 
-    def __init__(self, hp, damage, iconPath, initPosition: tuple, movingSpeed):
+    layer = LAYER_TANK
+
+    def __init__(self, hp, damage, iconPath, initPosition: tuple, movingSpeed, rotation=0):
         """
         构造方法，参数同BaseItem类，加入开火锁
         """
-        super().__init__(hp, damage, iconPath, initPosition, movingSpeed)
+        super().__init__(hp, damage, iconPath, initPosition, movingSpeed, rotation=rotation)
         self.firing = False
+        # 开火冷却剩余的毫秒数
+        self.fireCooldown = 0
 
     def fire(self, gameMap):
         """
-        开火类，发射一发导弹并将其加入组中，由线程来处理发射操作
+        开火方法，在导弹池里把导弹放到坦克面朝方向前一格，然后进入speed * 60毫秒的冷却，冷却由update方法推进
 
         :param gameMap: GameMap对象
         """
         if not self.firing:
             self.firing = True
-            print("{} started firing!".format(self))
-            t = threading.Thread(target=fireThread, args=(self, gameMap))
-            t.setDaemon(True)
-            t.start()
-
-
-def fireThread(obj: Tank, gameMap):
-    """
-    开火线程函数，把导弹放到坦克面朝方向前一格，并开始移动
+            x, y = self.rect.topleft
+            if self.direction == "UP":
+                y -= 50
+            elif self.direction == "DOWN":
+                y += 50
+            elif self.direction == "LEFT":
+                x -= 50
+            else:
+                x += 50
+            slot = gameMap.missiles.spawn(self, (x, y), self.direction, self.speed + 1, self.damage)
+            if events.enabled[FIRE]:
+                events.emit(FIRE, self, slot, DIRECTION_CODES[self.direction], self.damage)
+            self.fireCooldown = self.speed * 60
+
+    def update(self, tickMs=1000 / 60):
+        """
+        推进一个tick的移动动画和开火冷却
 
-    :param obj: 坦克对象
-    :param gameMap: 地图对象
-    """
-    x, y = obj.rect.topleft
-    if obj.direction == "UP":
-        y -= 50
-    elif obj.direction == "DOWN":
-        y += 50
-    elif obj.direction == "LEFT":
-        x -= 50
-    else:
-        x += 50
-    gameMap.groups["Missal"] = gameMap.groups.get("Missal", pygame.sprite.Group())
-    gameMap.groups["Missal"].add(Missal(obj.damage, (x, y), obj.direction, obj.speed + 1, gameMap, obj))
-    time.sleep(obj.speed * 60 / 1000)
-    obj.firing = False
+        :param tickMs: 一个tick的毫秒数
+        """
+        super().update(tickMs)
+        if self.firing:
+            self.fireCooldown -= tickMs
+            if self.fireCooldown <= 0:
+                self.fireCooldown = 0
+                self.firing = False
 
 
 class FriendlyTank(Tank):
@@ -58,6 +62,9 @@ class FriendlyTank(Tank):
     友方坦克类，继承自Tank类，只是定义了所用图片路径
     """
 
+    cellType = FRIENDLY_TANK
+    team = TEAM_PLAYER
+
     def __init__(self, hp, damage, initPosition, movingSpeed):
         """
         初始化方法，
@@ -70,41 +77,69 @@ class EnemyTank(Tank):
     敌方坦克类
     """
 
+    cellType = ENEMY_TANK
+    team = TEAM_ENEMY
+    # 最远向多少格之外的目标开火
+    fireRange = 12
+
     def __init__(self, hp, damage, iconPath, initPosition, movingSpeed):
         """
         构造方法，除了初始化图片之外，初始化了两个类变量，一个是stuckNum，表示坦克在一个地方卡了几次，3次就随机移动一个地方，另一个是invisible，
-        代表敌方坦克是否在地图上，这里是invisible所以True是看不见，其与参数同BaseItem
+        代表敌方坦克是否在地图上，这里是invisible所以True是看不见，其与参数同BaseItem。
+        nextDecision和dueSince由AIScheduler使用，分别是下次可以做决定的tick和开始排队的tick
         """
-        super().__init__(hp, damage, iconPath, initPosition, movingSpeed)
-        self.initImage = pygame.transform.rotate(self.initImage, 270)
-        self.image = self.initImage
+        super().__init__(hp, damage, iconPath, initPosition, movingSpeed, rotation=270)
         self.stuckNum = 0
         self.invisible = True
+        self.nextDecision = 0
+        self.dueSince = None
+
+    def shouldFire(self, targetTank: FriendlyTank):
+        """
+        判断现在开火有没有意义：面朝的方向上射程以内能看到玩家坦克或者基地，或者正前方是挡路的砖墙
+
+        :param targetTank: 玩家坦克对象
+        :return: 是否开火
+        """
+        gameMap = self.gameMapObj
+        cell = cellOf(self)
+        dx, dy = OFFSETS[self.direction]
+        ahead = (cell[0] + dx, cell[1] + dy)
+        if gameMap.occupancy.inBounds(*ahead) and gameMap.occupancy.typeAt(*ahead) == WALL:
+            return True
+        for target in [targetTank] + gameMap.groups["Base"].sprites():
+            if gameMap.sight.visible(cell, self.direction, cellOf(target), self.fireRange):
+                return True
+        return False
 
     def searchPath(self, targetTank: FriendlyTank):
         """
-        查找路径方法，如果坦克在一个地方卡了3次就随机移动一个地方，否则比较当前距离基地和玩家坦克之间的距离，选近的过去
+        查找路径方法，如果坦克在一个地方卡了3次就随机移动一个地方，否则在共享的距离场里比较到基地和到玩家坦克的代价，
+        选近的那个，查一下相邻格子就知道下一步往哪走
 
         :param targetTank: 玩家坦克对象
         :return: 下一步应该移动的方向
         """
-        # should change into A*
-        # Manhattan distance
         if self.lastStep == self.rect.topleft:
             self.stuckNum += 1
         if self.stuckNum >= 3:
             self.stuckNum = 0
-            return random.choice(["UP", "DOWN", "LEFT", "RIGHT"])
-        coordinateToTargetTank = (targetTank.rect.left - self.rect.left, targetTank.rect.top - self.rect.top)
-        coordinateToBase = (self.gameMapObj.groups["Base"].sprites()[0].rect.left - self.rect.left,
-                            self.gameMapObj.groups["Base"].sprites()[0].rect.top - self.rect.top)
-        disToBase = abs(coordinateToBase[0]) + abs(coordinateToBase[1])
-        disToTargetTank = abs(coordinateToTargetTank[0]) + abs(coordinateToTargetTank[1])
-        if disToBase <= disToTargetTank:
-            coor = coordinateToBase
+            return self.gameMapObj.random.choice(["UP", "DOWN", "LEFT", "RIGHT"])
+        navigator = self.gameMapObj.navigator
+        cell = cellOf(self)
+        base = self.gameMapObj.groups["Base"].sprites()[0]
+        baseField = navigator.field("Base", cellOf(base))
+        tankField = navigator.field("FriendlyTank", cellOf(targetTank))
+        if baseField.distanceAt(cell) <= tankField.distanceAt(cell):
+            field, target = baseField, base
         else:
-            coor = coordinateToTargetTank
+            field, target = tankField, targetTank
+        direction = field.nextDirection(cell)
+        if direction is not None:
+            return direction
 
+        # already on the target or no way there, head straight for it
+        coor = (target.rect.left - self.rect.left, target.rect.top - self.rect.top)
         if coor[1] < 0:
             return "UP"
         elif coor[1] > 0:
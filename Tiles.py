@@ -0,0 +1,196 @@
+import numpy as np
+import pygame
+
+from Assets import assets
+from Events import events, HIT, KILL
+from Layers import TEAM_NONE, LAYER_STATIC
+from Occupancy import EMPTY, WALL, METAL_WALL
+
+# 以图块形式存储的地形种类及其图片
+TILE_KINDS = {"Wall": (WALL, "images/Wall.png"), "MetalWall": (METAL_WALL, "images/MetalWall.png")}
+
+
+class TileType:
+    """
+    一种地形图块的共享数据（享元），同一种的所有格子共用伤害、初始血量、图片和碰撞遮罩
+    """
+
+    def __init__(self, kind: str, hp: int, damage: int):
+        """
+        :param kind: 种类名，"Wall"或"MetalWall"
+        :param hp: 初始血量，负数为无敌
+        :param damage: 碰撞时对对方造成的伤害
+        """
+        self.kind = kind
+        self.cellType, iconPath = TILE_KINDS[kind]
+        self.hp = int(hp)
+        self.damage = damage
+        self.invincible = self.hp < 0
+        self.asset = assets.get(iconPath)
+
+
+class Tile:
+    """
+    某一个图块格子的临时句柄，只在碰撞检测时创建，提供和BaseItem一样的attack/applyDamage接口，
+    血量直接读写占用网格里的数组
+    """
+
+    # 图块不属于任何精灵组，也不会隐身
+    invisible = False
+    team = TEAM_NONE
+    layer = LAYER_STATIC
+
+    def __init__(self, tileLayer, x: int, y: int):
+        """
+        :param tileLayer: TileLayer对象，layer是碰撞层
+        :param x: 格子横坐标
+        :param y: 格子纵坐标
+        """
+        self.tileLayer = tileLayer
+        self.x = x
+        self.y = y
+        self.type = tileLayer.types[int(tileLayer.occupancy.cellType[x, y])]
+        self.cellType = self.type.cellType
+        self.damage = self.type.damage
+        self.invincible = self.type.invincible
+        self.entityId = 0
+        self.image = self.type.asset.images["UP"]
+        self.mask = self.type.asset.masks["UP"]
+        self.rect = pygame.Rect(x * 50, y * 50, 50, 50)
+
+    def __repr__(self):
+        return "<{} Tile({}, {})>".format(self.type.kind, self.x, self.y)
+
+    @property
+    def hp(self):
+        return int(self.tileLayer.occupancy.hp[self.x, self.y])
+
+    def groups(self):
+        return []
+
+    def alive(self):
+        return self.tileLayer.occupancy.cellType[self.x, self.y] == self.cellType
+
+    def applyDamage(self, damage: int, source=None):
+        """
+        和BaseItem的applyDamage规则一样，血量归零时把格子清空
+
+        :param damage: 造成的伤害
+        :param source: 造成伤害的物体，用于统计
+        :return: 该图块是否是无敌状态。True - 无敌
+        """
+        gameMap = self.tileLayer.gameMap
+        occupancy = self.tileLayer.occupancy
+        if not self.invincible:
+            hp = self.hp
+            if hp - damage <= 0:
+                damage = hp
+                occupancy.cellType[self.x, self.y] = EMPTY
+                occupancy.hp[self.x, self.y] = 0
+                if events.enabled[HIT]:
+                    events.emit(HIT, self, source, damage, 0)
+                if events.enabled[KILL]:
+                    events.emit(KILL, self, source)
+                gameMap.itemKilled(self)
+            else:
+                occupancy.hp[self.x, self.y] = hp - damage
+                if events.enabled[HIT]:
+                    events.emit(HIT, self, source, damage, hp - damage)
+                gameMap.itemDamaged(self)
+            gameMap.recordDamage(source, self, damage)
+        elif events.enabled[HIT]:
+            events.emit(HIT, self, source, 0, self.hp)
+        return self.invincible
+
+
+class TileLayer:
+    """
+    静态地形的图块层。砖墙和金属墙不再是一个个精灵，而是占用网格上的类型码和血量，
+    加上每种地形一份共享的TileType，碰撞检测时只为和物体重叠的格子创建Tile句柄
+    """
+
+    def __init__(self, gameMap):
+        """
+        :param gameMap: GameMap对象，图块的类型和血量存在它的占用网格里
+        """
+        self.gameMap = gameMap
+        self.occupancy = gameMap.occupancy
+        # cell type -> TileType
+        self.types = {}
+
+    def addType(self, kind: str, hp: int, damage: int):
+        """
+        登记一种地形
+
+        :param kind: 种类名
+        :param hp: 初始血量
+        :param damage: 伤害
+        """
+        tileType = TileType(kind, hp, damage)
+        self.types[tileType.cellType] = tileType
+
+    def setTile(self, x: int, y: int, kind: str):
+        """
+        在格子上放一块地形，该种地形需要已经登记过
+
+        :param x: 格子横坐标
+        :param y: 格子纵坐标
+        :param kind: 种类名
+        """
+        tileType = self.types[TILE_KINDS[kind][0]]
+        self.occupancy.cellType[x, y] = tileType.cellType
+        self.occupancy.hp[x, y] = tileType.hp
+
+    def isTile(self, x: int, y: int):
+        """
+        :return: 格子上是否有图块
+        """
+        return int(self.occupancy.cellType[x, y]) in self.types
+
+    def tiles(self):
+        """
+        :return: 所有图块格子的(x数组, y数组)
+        """
+        return np.nonzero(np.isin(self.occupancy.cellType, list(self.types)))
+
+    def candidates(self, sprite):
+        """
+        粗筛：返回和精灵遮罩覆盖的矩形有重叠的所有图块
+
+        :param sprite: 精灵对象
+        :return: Tile对象的列表
+        """
+        width, height = sprite.mask.get_size()
+        left, top = sprite.rect.topleft
+        result = []
+        for x in range(max(left // 50, 0), min((left + width - 1) // 50 + 1, self.occupancy.width)):
+            for y in range(max(top // 50, 0), min((top + height - 1) // 50 + 1, self.occupancy.height)):
+                if self.isTile(x, y):
+                    result.append(Tile(self, x, y))
+        return result
+
+    def drawCell(self, surface, x: int, y: int, origin=(0, 0)):
+        """
+        把一个格子上的图块画到surface上
+
+        :param origin: surface左上角对应的世界坐标
+        :return: 是否画了
+        """
+        tileType = self.types.get(int(self.occupancy.cellType[x, y]))
+        if tileType is None:
+            return False
+        surface.blit(tileType.asset.images["UP"], (x * 50 - origin[0], y * 50 - origin[1]))
+        return True
+
+    def draw(self, surface, region=None):
+        """
+        把图块画到surface上
+
+        :param region: 要画的格子范围(left, top, right, bottom)，不含right和bottom，surface的左上角对应(left, top)格子；
+                       None为整张地图
+        """
+        left, top, right, bottom = region or (0, 0, self.occupancy.width, self.occupancy.height)
+        cellTypes = self.occupancy.cellType[left:right, top:bottom]
+        xs, ys = np.nonzero(np.isin(cellTypes, list(self.types)))
+        surface.blits([(self.types[int(t)].asset.images["UP"], (int(x) * 50, int(y) * 50))
+                       for t, x, y in zip(cellTypes[xs, ys], xs, ys)], False)
@@ -0,0 +1,163 @@
+import csv
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Engine import SimulationResult, runHeadless, WIN, TIMEOUT
+from GameMap import readHeader
+from MapLoader import findMaps
+
+# 结果文件的字段，和SimulationResult一致，另外加上出错信息
+FIELDS = list(SimulationResult._fields) + ["error"]
+
+
+def enemyConfigs(mapPath: str):
+    """
+    从地图头部获取所有的敌方坦克配置，None代表按地图原样，其余为每一种敌方坦克的简称
+
+    :param mapPath: 地图路径
+    :return: 配置列表
+    """
+    return [None] + [tanks["name"] for tanks in readHeader(mapPath)["EnemyTank"]]
+
+
+def initWorker():
+    """
+    工作进程的初始化函数，忽略Ctrl+C交给主进程处理，并丢掉模拟过程中的输出
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sys.stdout = open(os.devnull, "w")
+
+
+def runOne(mapPath: str, seed: int, enemyConfig, tickLimit: int, timeLimit: float):
+    """
+    在工作进程里跑一局，出错时也返回一条记录而不是让整个比赛中断
+
+    :return: 结果字典
+    """
+    try:
+        result = runHeadless(mapPath, seed=seed, tickLimit=tickLimit, timeLimit=timeLimit, enemyConfig=enemyConfig)
+        record = result._asdict()
+        record["error"] = None
+    except Exception as e:
+        record = dict.fromkeys(FIELDS)
+        record.update(map=mapPath, seed=seed, enemyConfig=enemyConfig, error=repr(e))
+    return record
+
+
+class ResultWriter:
+    """
+    结果写入器，根据扩展名写JSONL或CSV，每条结果写完立即flush，中途取消也不会丢失已完成的结果
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "w", newline="")
+        self.csv = None
+        if os.path.splitext(path)[1] == ".csv":
+            self.csv = csv.DictWriter(self.file, FIELDS)
+            self.csv.writeheader()
+
+    def write(self, record: dict):
+        if self.csv is not None:
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def summarize(records):
+    """
+    按地图汇总胜率和平均tick数
+
+    :param records: 结果字典的列表
+    :return: 地图到(局数, 胜率, 超时率, 平均tick数, 出错局数)的字典
+    """
+    summary = {}
+    for record in records:
+        summary.setdefault(record["map"], []).append(record)
+    table = {}
+    for mapPath, runs in sorted(summary.items()):
+        finished = [r for r in runs if r["error"] is None]
+        n = len(finished)
+        wins = sum(1 for r in finished if r["outcome"] == WIN)
+        timeouts = sum(1 for r in finished if r["outcome"] == TIMEOUT)
+        meanTicks = sum(r["ticks"] for r in finished) / n if n else 0.0
+        table[mapPath] = (n, wins / n if n else 0.0, timeouts / n if n else 0.0, meanTicks, len(runs) - n)
+    return table
+
+
+def printSummary(table):
+    print("{:<20}{:>8}{:>10}{:>10}{:>12}{:>8}".format("map", "runs", "win rate", "timeout", "mean ticks", "errors"))
+    for mapPath, (n, winRate, timeoutRate, meanTicks, errors) in table.items():
+        print("{:<20}{:>8}{:>10.1%}{:>10.1%}{:>12.1f}{:>8}".format(mapPath, n, winRate, timeoutRate, meanTicks,
+                                                                   errors))
+
+
+def tournament(outputPath: str, seeds: int = 10, maps=None, workers=None, tickLimit=60 * 60 * 5, timeLimit=60.0):
+    """
+    在进程池里跑遍 地图 × 种子 × 敌方配置 的所有组合，结果一完成就写入文件，最后打印汇总表。
+    按Ctrl+C会取消还没开始的对局，等正在跑的对局结束后照常输出汇总。
+
+    :param outputPath: 结果文件路径，.csv为CSV，其余为JSONL
+    :param seeds: 每个组合跑的种子数
+    :param maps: 地图列表，None为根目录下的所有地图
+    :param workers: 进程数，None为CPU核数
+    :param tickLimit: 每局最多模拟的tick数
+    :param timeLimit: 每局最多运行的真实秒数
+    :return: 汇总表
+    """
+    if maps is None:
+        maps = findMaps()
+    tasks = [(mapPath, seed, config) for mapPath in maps for config in enemyConfigs(mapPath) for seed in range(seeds)]
+    print("Running {} games on {} maps with {} workers...".format(len(tasks), len(maps), workers or os.cpu_count()))
+    records = []
+    writer = ResultWriter(outputPath)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=initWorker)
+    futures = []
+    written = set()
+
+    def collect(future):
+        written.add(future)
+        record = future.result()
+        records.append(record)
+        writer.write(record)
+
+    start = time.perf_counter()
+    try:
+        futures = [executor.submit(runOne, mapPath, seed, config, tickLimit, timeLimit)
+                   for mapPath, seed, config in tasks]
+        for future in as_completed(futures):
+            collect(future)
+    except KeyboardInterrupt:
+        print("Cancelled, waiting for running games to finish...")
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if future.done() and not future.cancelled() and future not in written:
+                collect(future)
+    finally:
+        executor.shutdown(wait=True)
+        writer.close()
+    print("{} of {} games finished in {:.1f}s.".format(len(records), len(tasks), time.perf_counter() - start))
+    table = summarize(records)
+    printSummary(table)
+    return table
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="用进程池并行跑遍所有地图、种子和敌方配置")
+    parser.add_argument("--output", default="tournament.jsonl", help="结果文件，.csv为CSV，其余为JSONL")
+    parser.add_argument("--seeds", type=int, default=10, help="每个组合跑的种子数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument("--ticks", type=int, default=60 * 60 * 5, help="每局最多模拟的tick数")
+    parser.add_argument("--timeout", type=float, default=60.0, help="每局最多运行的真实秒数")
+    parser.add_argument("maps", nargs="*", help="地图路径，默认为当前目录下所有的地图")
+    args = parser.parse_args()
+    tournament(args.output, args.seeds, args.maps or None, args.workers, args.ticks, args.timeout)
@@ -0,0 +1,150 @@
+import contextlib
+import io
+
+import numpy as np
+
+from Engine import Simulation, WIN, LOSE, TIMEOUT
+from Occupancy import WALL, METAL_WALL, BASE, FRIENDLY_TANK, ENEMY_TANK
+
+# 动作编号，actions数组里存的是这里的下标
+ACTIONS = (None, "UP", "DOWN", "LEFT", "RIGHT", "FIRE")
+# 观测的通道，前三个来自占用网格的静态层，接下来两个来自单位层，最后一个是导弹
+CHANNELS = ("Wall", "MetalWall", "Base", "FriendlyTank", "EnemyTank", "Missile")
+STATIC_TYPES = (WALL, METAL_WALL, BASE)
+UNIT_TYPES = (FRIENDLY_TANK, ENEMY_TANK)
+# 奖励：每点伤害的奖励（造成的为正，受到的为负），以及胜负的奖励
+DAMAGE_REWARD = 0.01
+WIN_REWARD = 1.0
+LOSE_REWARD = -1.0
+
+
+class VectorEnv:
+    """
+    批量的训练环境，在一个进程里持有K局互相独立的游戏，按动作数组同步推进，观测是一个K x 通道 x 高 x 宽的NumPy张量。
+    一局结束（胜负已分或者超过tickLimit）后自动开始新的一局，新一局的种子依次递增，所以整批的结果是确定性的。
+    观测、奖励和结束标志的数组只分配一次，每一步原地写入，调用方需要保留时自己复制
+    """
+
+    def __init__(self, mapPaths, count=None, seed=0, tickLimit=60 * 60 * 2, ticksPerStep=1, enemyConfig=None):
+        """
+        :param mapPaths: 地图路径，或者每一局各自的地图路径列表，所有地图的格子数必须相同
+        :param count: 局数K，mapPaths是列表时默认为列表的长度
+        :param seed: 第一批游戏的起始种子
+        :param tickLimit: 一局最多的tick数，超过即判为超时并结束
+        :param ticksPerStep: 每一步推进的tick数，动作只在第一个tick执行
+        :param enemyConfig: 所有敌方坦克统一使用的配置简称，None为按地图原样
+        """
+        if isinstance(mapPaths, str):
+            mapPaths = [mapPaths] * (count or 1)
+        elif count is not None:
+            mapPaths = [mapPaths[i % len(mapPaths)] for i in range(count)]
+        self.mapPaths = list(mapPaths)
+        self.count = len(self.mapPaths)
+        self.tickLimit = tickLimit
+        self.ticksPerStep = ticksPerStep
+        self.enemyConfig = enemyConfig
+        self.nextSeed = seed
+        self.simulations = [None] * self.count
+        # damage dealt and taken at the last step, rewards are the differences
+        self.lastDamage = np.zeros((self.count, 2), np.int64)
+        # 每一局最近一次结束时的结果和tick数，还没有结束过时为None
+        self.outcomes = [None] * self.count
+        self.episodeTicks = [0] * self.count
+        self.episodes = 0
+
+        for k in range(self.count):
+            self.resetEnv(k)
+        width, height = self.simulations[0].map.occupancy.width, self.simulations[0].map.occupancy.height
+        for simulation in self.simulations:
+            if (simulation.map.occupancy.width, simulation.map.occupancy.height) != (width, height):
+                raise ValueError("all maps must have the same size, {} is {}x{} instead of {}x{}".format(
+                    simulation.mapPath, simulation.map.occupancy.width, simulation.map.occupancy.height,
+                    width, height))
+        self.width = width
+        self.height = height
+        self.observations = np.zeros((self.count, len(CHANNELS), height, width), np.uint8)
+        self.rewards = np.zeros(self.count, np.float32)
+        self.dones = np.zeros(self.count, bool)
+        for k in range(self.count):
+            self.observe(k)
+
+    def resetEnv(self, k: int):
+        """
+        用下一个种子重新开始第k局
+
+        :param k: 局的编号
+        """
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulation = Simulation(self.mapPaths[k], seed=self.nextSeed, autoSpawn=True, enemyConfig=self.enemyConfig)
+        self.nextSeed += 1
+        self.simulations[k] = simulation
+        self.lastDamage[k] = 0
+
+    def reset(self):
+        """
+        重新开始所有的局
+
+        :return: 观测张量
+        """
+        for k in range(self.count):
+            self.resetEnv(k)
+        self.rewards.fill(0)
+        self.dones.fill(False)
+        for k in range(self.count):
+            self.observe(k)
+        return self.observations
+
+    def observe(self, k: int):
+        """
+        把第k局的状态写进观测张量，每个通道在有对应物体的格子上为1
+
+        :param k: 局的编号
+        """
+        m = self.simulations[k].map
+        observation = self.observations[k]
+        # the grids are indexed [x, y], the observation [y, x]
+        cellType, unitType = m.occupancy.cellType.T, m.occupancy.unitType.T
+        for channel, code in enumerate(STATIC_TYPES):
+            np.equal(cellType, code, out=observation[channel], casting="unsafe")
+        for channel, code in enumerate(UNIT_TYPES, len(STATIC_TYPES)):
+            np.equal(unitType, code, out=observation[channel], casting="unsafe")
+        missiles = observation[-1]
+        missiles.fill(0)
+        slots = m.missiles.slots()
+        if len(slots):
+            # centre of the missile, clipped because a missile leaving the map is removed one tick later
+            center = m.missiles.position[slots] + m.missiles.sizes[m.missiles.direction[slots]] // 2
+            x = np.clip(center[:, 0] // 50, 0, self.width - 1)
+            y = np.clip(center[:, 1] // 50, 0, self.height - 1)
+            missiles[y, x] = 1
+
+    def step(self, actions):
+        """
+        所有的局各执行一个动作并推进ticksPerStep个tick，结束的局自动重新开始，
+        这时返回的是新一局的第一个观测，结束时的结果记在outcomes里
+
+        :param actions: 长度为K的整数数组，ACTIONS里的下标
+        :return: (观测张量, 奖励数组, 结束标志数组)
+        """
+        for k, simulation in enumerate(self.simulations):
+            simulation.applyAction(ACTIONS[actions[k]])
+            for _ in range(self.ticksPerStep):
+                if simulation.step() is not None or simulation.scheduler.ticks >= self.tickLimit:
+                    break
+            m = simulation.map
+            reward = ((m.damageDealt - self.lastDamage[k, 0]) - (m.damageTaken - self.lastDamage[k, 1])) * DAMAGE_REWARD
+            self.lastDamage[k] = m.damageDealt, m.damageTaken
+            done = simulation.outcome is not None or simulation.scheduler.ticks >= self.tickLimit
+            if simulation.outcome == WIN:
+                reward += WIN_REWARD
+            elif simulation.outcome == LOSE:
+                reward += LOSE_REWARD
+            self.rewards[k] = reward
+            self.dones[k] = done
+            if done:
+                self.outcomes[k] = simulation.outcome or TIMEOUT
+                self.episodeTicks[k] = simulation.scheduler.ticks
+                self.episodes += 1
+                self.resetEnv(k)
+            self.observe(k)
+        return self.observations, self.rewards, self.dones
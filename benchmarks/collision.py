@@ -0,0 +1,115 @@
+"""
+碰撞检测的微基准测试，在同一局游戏的同一帧上分别测量旧的检测方式和现在的检测方式的耗时。
+
+旧方式：每个会动的物体和所有组里的所有物体两两检测，collide_mask每次都从Surface重新生成两个Mask。
+新方式：空间哈希粗筛，rect预判，使用图片缓存中预先生成的Mask。
+
+用法：python -m benchmarks.collision [--ticks 600] [地图 ...]
+"""
+import contextlib
+import io
+import time
+
+import pygame
+from Engine import Simulation, huntPolicy
+from Scheduler import TickScheduler
+from SpatialHash import collide
+
+
+def legacyPass(m):
+    """
+    旧的检测方式，只检测不造成伤害
+
+    :return: (测试的对数, 碰撞的对数)
+    """
+    tested = hits = 0
+    for key in TickScheduler.MOVING_GROUPS:
+        if key not in m.groups:
+            continue
+        for tank in m.groups[key]:
+            for targetGroup in m.groups.keys():
+                for item in m.groups[targetGroup]:
+                    if item is tank:
+                        continue
+                    tested += 1
+                    # what collide_mask did when the sprites had no mask attribute
+                    offset = (tank.rect.left - item.rect.left, tank.rect.top - item.rect.top)
+                    if pygame.mask.from_surface(item.image).overlap(pygame.mask.from_surface(tank.image), offset):
+                        hits += 1
+    return tested, hits
+
+
+def currentPass(m):
+    """
+    现在的检测方式，只检测不造成伤害
+
+    :return: (测试的对数, 碰撞的对数)
+    """
+    tested = hits = 0
+    for key in TickScheduler.MOVING_GROUPS:
+        if key not in m.groups:
+            continue
+        for tank in m.groups[key].sprites():
+            m.spatialHash.update(tank)
+            for item in m.spatialHash.query(tank):
+                tested += 1
+                if collide(item, tank):
+                    hits += 1
+    m.spatialHash.nextFrame()
+    return tested, hits
+
+
+def benchmark(mapPath: str, ticks=600, seed=0):
+    """
+    跑ticks个tick，每个tick先分别测量两种检测方式，再正常推进游戏
+
+    :return: 结果字典
+    """
+    simulation = Simulation(mapPath, seed=seed, autoSpawn=True)
+    legacyTime = currentTime = 0.0
+    legacyPairs = currentPairs = simulatedPairs = 0
+    frames = 0
+    for _ in range(ticks):
+        start = time.perf_counter()
+        tested, legacyHits = legacyPass(simulation.map)
+        legacyTime += time.perf_counter() - start
+        legacyPairs += tested
+        start = time.perf_counter()
+        tested, currentHits = currentPass(simulation.map)
+        currentTime += time.perf_counter() - start
+        currentPairs += tested
+        frames += 1
+        simulation.applyAction(huntPolicy(simulation))
+        outcome = simulation.step()
+        # pairs the real collision pass tested, sprites and wall tiles
+        simulatedPairs += simulation.map.spatialHash.lastPairsTested
+        if outcome is not None:
+            break
+    return {
+        "map": mapPath,
+        "frames": frames,
+        "legacyUsPerFrame": legacyTime / frames * 1e6,
+        "currentUsPerFrame": currentTime / frames * 1e6,
+        "legacyPairsPerFrame": legacyPairs / frames,
+        "currentPairsPerFrame": currentPairs / frames,
+        "simulatedPairsPerFrame": simulatedPairs / frames,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="碰撞检测前后对比的微基准测试")
+    parser.add_argument("--ticks", type=int, default=600, help="最多测量的tick数")
+    parser.add_argument("maps", nargs="*", default=["level1.map", "level2.map"], help="地图路径")
+    args = parser.parse_args()
+    print("{:<14}{:>8}{:>16}{:>16}{:>10}{:>14}{:>14}{:>14}".format(
+        "map", "frames", "before us/frame", "after us/frame", "speedup", "before pairs", "after pairs", "tick pairs"))
+    for mapPath in args.maps:
+        # the game logs every move and hit, keep it out of the table
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = benchmark(mapPath, args.ticks)
+        print("{:<14}{:>8}{:>16.1f}{:>16.1f}{:>9.1f}x{:>14.1f}{:>14.1f}{:>14.1f}".format(
+            r["map"], r["frames"], r["legacyUsPerFrame"], r["currentUsPerFrame"],
+            r["legacyUsPerFrame"] / r["currentUsPerFrame"], r["legacyPairsPerFrame"], r["currentPairsPerFrame"],
+            r["simulatedPairsPerFrame"]))
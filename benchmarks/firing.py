@@ -0,0 +1,74 @@
+"""
+敌方坦克开火的基准测试，在同样的地图和种子上分别跑不看视线、停下来就开火的旧规则和现在按视线索引决定开火的规则，
+比较敌方坦克的开火次数、平均同时存在的导弹数、对局结果和结束的tick数（越小说明敌人越危险）。
+
+用法：python -m benchmarks.firing [--seeds 4] [--ticks 3000] [地图 ...]，不给地图时使用level1、level2和两张生成的地图
+"""
+import contextlib
+import io
+import os
+import tempfile
+
+from Engine import Simulation, huntPolicy, idlePolicy
+from Layers import TEAM_ENEMY
+from MapGenerator import generateMap
+from Tanks import EnemyTank
+
+
+def play(mapPath: str, policy, seed: int, tickLimit: int):
+    """
+    跑一局并统计敌方坦克的开火
+
+    :return: (结果, tick数, 受到的伤害, 开火次数, 平均导弹数)
+    """
+    simulation = Simulation(mapPath, seed=seed, autoSpawn=True)
+    m = simulation.map
+    fires = [0]
+    spawn = m.missiles.spawn
+
+    def countingSpawn(owner, *args):
+        if owner.team == TEAM_ENEMY:
+            fires[0] += 1
+        return spawn(owner, *args)
+
+    m.missiles.spawn = countingSpawn
+    missiles = 0
+    while simulation.outcome is None and simulation.scheduler.ticks < tickLimit:
+        simulation.applyAction(policy(simulation))
+        simulation.step()
+        missiles += len(m.missiles)
+    ticks = simulation.scheduler.ticks
+    return simulation.outcome or "timeout", ticks, m.damageTaken, fires[0], missiles / ticks
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="比较开火规则")
+    parser.add_argument("maps", nargs="*", help="地图路径")
+    parser.add_argument("--seeds", type=int, default=4, help="每张地图跑的种子数")
+    parser.add_argument("--ticks", type=int, default=3000, help="每局最多的tick数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        maps = args.maps or ["level1.map", "level2.map",
+                             generateMap(os.path.join(directory, "open30.map"), 30, enemies=20, seed=1),
+                             generateMap(os.path.join(directory, "dense20.map"), 20, enemies=10, density=0.3, seed=2)]
+        shouldFire = EnemyTank.shouldFire
+        print("{:<14}{:>8}{:>12}{:>10}{:>10}{:>10}{:>12}{:>10}{:>10}".format(
+            "map", "policy", "rule", "outcome", "ticks", "taken", "fires/kt", "missiles", "losses"))
+        for mapPath in maps:
+            for policy in (idlePolicy, huntPolicy):
+                for rule, gate in (("always", lambda self, target: True), ("sight", shouldFire)):
+                    EnemyTank.shouldFire = gate
+                    results = []
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for seed in range(args.seeds):
+                            results.append(play(mapPath, policy, seed, args.ticks))
+                    EnemyTank.shouldFire = shouldFire
+                    n = len(results)
+                    ticks = sum(r[1] for r in results)
+                    print("{:<14}{:>8}{:>12}{:>10}{:>10.0f}{:>10.0f}{:>12.1f}{:>10.1f}{:>10}".format(
+                        os.path.basename(mapPath), policy.__name__[:-6], rule, results[0][0], ticks / n,
+                        sum(r[2] for r in results) / n, sum(r[3] for r in results) * 1000 / ticks,
+                        sum(r[4] * r[1] for r in results) / ticks, sum(r[0] == "lose" for r in results)))
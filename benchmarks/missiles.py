@@ -0,0 +1,76 @@
+"""
+导弹池的压力测试，在一张地图上保持固定数量的导弹一直在飞，分别测量每个tick推进和碰撞检测所有导弹的耗时。
+
+导弹由玩家坦克和第一辆敌方坦克轮流发射，从随机的空格子朝随机方向出发，越界或撞毁的导弹马上补上，
+所以槽位会被不断回收再利用。默认使用一张生成的空旷地图，也可以指定现有地图（小地图上导弹几乎每个tick都会撞毁）。
+
+用法：python -m benchmarks.missiles [--ticks 300] [--counts 100 1000 5000] [--size 60] [地图]
+"""
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from Engine import Simulation
+from MapGenerator import generateMap
+from Missiles import DIRECTIONS
+
+def benchmark(mapPath: str, count: int, ticks=300, seed=0):
+    """
+    :param count: 保持存活的导弹数量
+    :return: 结果字典
+    """
+    simulation = Simulation(mapPath, seed=seed)
+    simulation.spawnNext()
+    m = simulation.map
+    rng = m.random
+    owners = [simulation.player, m.groups["EnemyTank"].sprites()[0]]
+    cells = m.occupancy.freeCells()
+    # keep the tanks alive, only the missiles are measured
+    for tank in owners:
+        tank.invincible = True
+    spawned = 0
+    stepTime = collideTime = 0.0
+    for _ in range(ticks):
+        while len(m.missiles) < count:
+            x, y = cells[rng.randrange(len(cells))]
+            m.missiles.spawn(owners[spawned % 2], (int(x) * 50, int(y) * 50), rng.choice(DIRECTIONS), 5, 1)
+            spawned += 1
+        start = time.perf_counter()
+        m.missiles.step()
+        stepTime += time.perf_counter() - start
+        start = time.perf_counter()
+        m.missiles.collide()
+        collideTime += time.perf_counter() - start
+    return {
+        "map": os.path.basename(mapPath),
+        "missiles": count,
+        "stepUsPerTick": stepTime / ticks * 1e6,
+        "collideUsPerTick": collideTime / ticks * 1e6,
+        "respawnedPerTick": (spawned - count) / ticks,
+        "capacity": m.missiles.capacity,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="导弹池推进和碰撞检测的压力测试")
+    parser.add_argument("--ticks", type=int, default=300, help="测量的tick数")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000], help="同时存活的导弹数量")
+    parser.add_argument("--size", type=int, default=60, help="没有指定地图时生成的空旷地图的边长（格子数）")
+    parser.add_argument("map", nargs="?", help="地图路径")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        mapPath = args.map or generateMap(os.path.join(directory, "open{}.map".format(args.size)), args.size,
+                                          density=0, enemies=1)
+        print("{:<14}{:>10}{:>16}{:>18}{:>18}{:>8}".format(
+            "map", "missiles", "step us/tick", "collide us/tick", "respawned/tick", "slots"))
+        for count in args.counts:
+            # the game logs every hit, keep it out of the table
+            with contextlib.redirect_stdout(io.StringIO()):
+                r = benchmark(mapPath, count, args.ticks)
+            print("{:<14}{:>10}{:>16.1f}{:>18.1f}{:>18.1f}{:>8}".format(
+                r["map"], r["missiles"], r["stepUsPerTick"], r["collideUsPerTick"], r["respawnedPerTick"],
+                r["capacity"]))
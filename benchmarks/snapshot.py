@@ -0,0 +1,63 @@
+"""
+快照的基准测试：在每张地图上跑到一半时拍快照，测量快照的大小、压缩后的大小、拍快照和恢复的平均耗时，
+并检查恢复之后接着跑和原来的结果逐tick一致。
+
+用法：python -m benchmarks.snapshot [--repeat 200] [地图 ...]
+"""
+import contextlib
+import io
+import time
+import zlib
+
+from Engine import Simulation, huntPolicy
+from Replay import stateHash
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="快照的大小和耗时")
+    parser.add_argument("maps", nargs="*", default=["level1.map", "level2.map"], help="地图路径")
+    parser.add_argument("--repeat", type=int, default=200, help="拍快照和恢复各重复的次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args()
+
+    print("{:<14}{:>8}{:>10}{:>12}{:>14}{:>14}{:>10}".format(
+        "map", "tick", "bytes", "zlib bytes", "capture us", "restore us", "resumes"))
+    for mapPath in args.maps:
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulation = Simulation(mapPath, seed=args.seed, autoSpawn=True)
+        # play a whole game once to find its length, then snapshot the middle of a second one
+        actions = []
+        while simulation.outcome is None and simulation.scheduler.ticks < 60 * 60:
+            actions.append(huntPolicy(simulation))
+            simulation.applyAction(actions[-1])
+            simulation.step()
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulation = Simulation(mapPath, seed=args.seed, autoSpawn=True)
+        middle = len(actions) // 2
+        for action in actions[:middle]:
+            simulation.applyAction(action)
+            simulation.step()
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            blob = simulation.snapshot()
+        captureUs = (time.perf_counter() - start) / args.repeat * 1e6
+        hashes = []
+        for action in actions[middle:]:
+            simulation.applyAction(action)
+            simulation.step()
+            hashes.append(stateHash(simulation))
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            simulation.restore(blob)
+        restoreUs = (time.perf_counter() - start) / args.repeat * 1e6
+
+        resumed = []
+        for action in actions[middle:]:
+            simulation.applyAction(action)
+            simulation.step()
+            resumed.append(stateHash(simulation))
+        print("{:<14}{:>8}{:>10}{:>12}{:>14.0f}{:>14.0f}{:>10}".format(
+            mapPath, middle, len(blob), len(zlib.compress(blob)), captureUs, restoreUs,
+            "same" if resumed == hashes else "DIFFERENT"))
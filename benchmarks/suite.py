@@ -0,0 +1,217 @@
+"""
+在一组生成的地图上跑基准测试矩阵：地图边长 x 敌方坦克数量（墙密度固定），每一组测量
+地图第一次加载（解析并写缓存）和再次加载（读缓存）的耗时、每个tick的平均和p99耗时、碰撞检测耗时、searchPath耗时、
+渲染耗时、进程的峰值内存和AI的平均排队长度。
+
+每一组在单独的进程里跑，峰值内存互不影响。所有敌方坦克一开始就全部放出，玩家坦克和基地设为无敌，
+保证每一组都能跑满指定的tick数。渲染和游戏里一样画到最大为VIEWPORT的窗口里、摄像机跟随玩家坦克，
+给出--lod-radius时远处的敌方坦克以低精度模拟，给出--ai-max-decisions时每个tick最多让这么多辆敌方坦克做决定。
+
+结果写进JSON文件；给出--compare时和之前保存的结果逐项比较，变慢超过阈值的记为退化，有退化时退出码为1。
+
+用法：python -m benchmarks.suite [--sizes 20 50 100 200 500] [--enemies 10 100 1000] [--density 0.2]
+                                 [--ticks 60] [--lod-radius 2] [--ai-max-decisions 32] [--ai-lod-ticks 4]
+                                 [--output benchmark.json] [--compare baseline.json] [--threshold 0.25]
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 越小越好的指标
+METRICS = ("loadMs", "loadCachedMs", "tickUs", "tickP99Us", "collideUs", "searchPathUs", "renderUs", "peakRssMb")
+
+
+def peakRssMb():
+    """
+    :return: 当前进程的峰值常驻内存（MB），不支持的平台返回None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def runCase(directory: str, size: int, density: float, enemies: int, ticks: int, seed: int, lodRadius=None,
+            aiMaxDecisions=None, aiLodTicks=0):
+    """
+    在工作进程里跑一组测试
+
+    :param directory: 放生成的地图的目录
+    :param size: 地图边长（格子数）
+    :param density: 墙密度
+    :param enemies: 敌方坦克数量
+    :param ticks: 测量的tick数
+    :param seed: 随机数种子
+    :param lodRadius: 低精度模拟的半径（块数），None为全部完整精度
+    :param aiMaxDecisions: 每个tick最多做决定的敌方坦克数，None为不限制
+    :param aiLodTicks: 远处的敌方坦克每远一块增加的决定间隔（tick）
+    :return: 结果字典
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from Assets import assets
+    from Camera import Camera, VIEWPORT
+    from Engine import Simulation, huntPolicy
+    from GameMap import GameMap
+    from MapGenerator import generateMap
+    from Renderer import Renderer
+
+    path = generateMap(os.path.join(directory, "bench-{}-{}-{}.map".format(size, density, enemies)),
+                       size, density=density, enemies=enemies, seed=seed)
+    timers = dict.fromkeys(("collide", "searchPath", "render"), 0.0)
+
+    def timed(func, name):
+        def wrapper(*args):
+            start = time.perf_counter()
+            result = func(*args)
+            timers[name] += time.perf_counter() - start
+            return result
+
+        return wrapper
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        GameMap(path)
+        loadMs = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        GameMap(path)
+        loadCachedMs = (time.perf_counter() - start) * 1000
+
+        simulation = Simulation(path, seed=seed, lodRadius=lodRadius, aiMaxDecisions=aiMaxDecisions,
+                                aiLodTicks=aiLodTicks)
+        m = simulation.map
+        while simulation.spawnIndex < len(m.groups["InvisibleEnemyTank"]):
+            simulation.spawnNext()
+        simulation.player.invincible = True
+        for base in m.groups["Base"]:
+            base.invincible = True
+        simulation.collide = timed(simulation.collide, "collide")
+        for tank in m.groups["EnemyTank"]:
+            tank.searchPath = timed(tank.searchPath, "searchPath")
+        pygame.init()
+        camera = Camera(m, VIEWPORT)
+        screen = pygame.display.set_mode(camera.size, 0, 32)
+        assets.convertAll()
+        m.refreshImages()
+        renderer = Renderer(m, screen, camera)
+        camera.follow(simulation.player)
+        renderer.draw()
+
+        tickTimes = []
+        queued = 0
+        for _ in range(ticks):
+            start = time.perf_counter()
+            simulation.applyAction(huntPolicy(simulation))
+            simulation.step()
+            tickTimes.append(time.perf_counter() - start)
+            queued += simulation.ai.queueLength
+            start = time.perf_counter()
+            camera.follow(simulation.player)
+            renderer.draw()
+            timers["render"] += time.perf_counter() - start
+
+    return {
+        "size": size,
+        "density": density,
+        "enemies": enemies,
+        "ticks": ticks,
+        "loadMs": loadMs,
+        "loadCachedMs": loadCachedMs,
+        "tickUs": sum(tickTimes) / ticks * 1e6,
+        "tickP99Us": sorted(tickTimes)[min(ticks - 1, int(ticks * 0.99))] * 1e6,
+        "collideUs": timers["collide"] / ticks * 1e6,
+        "searchPathUs": timers["searchPath"] / ticks * 1e6,
+        "renderUs": timers["render"] / ticks * 1e6,
+        "peakRssMb": peakRssMb(),
+        "aiQueue": queued / ticks,
+    }
+
+
+def caseKey(result: dict):
+    return result["size"], result["density"], result["enemies"]
+
+
+def compare(results, baseline, threshold: float):
+    """
+    和之前保存的结果比较
+
+    :param results: 这次的结果列表
+    :param baseline: 之前的结果列表
+    :param threshold: 允许变慢的比例，例如0.25为允许慢25%
+    :return: 退化的(结果, 指标, 之前的值, 现在的值)列表
+    """
+    baseline = {caseKey(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = baseline.get(caseKey(result))
+        if old is None:
+            continue
+        for metric in METRICS:
+            before, after = old.get(metric), result.get(metric)
+            if before and after is not None and after > before * (1 + threshold):
+                regressions.append((result, metric, before, after))
+    return regressions
+
+
+def printTable(results):
+    columns = ("size", "enemies") + METRICS + ("aiQueue",)
+    print("".join("{:>14}".format(c) for c in columns))
+    for r in results:
+        print("".join("{:>14}".format("-" if r[c] is None else "{:.1f}".format(r[c]) if isinstance(r[c], float)
+                                      else r[c]) for c in columns))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在生成的地图上跑基准测试矩阵")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 100, 200, 500], help="地图边长（格子数）")
+    parser.add_argument("--enemies", type=int, nargs="+", default=[10, 100, 1000], help="敌方坦克数量")
+    parser.add_argument("--density", type=float, default=0.2, help="内部格子是墙的概率")
+    parser.add_argument("--ticks", type=int, default=60, help="每一组测量的tick数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--lod-radius", type=int, help="离玩家超过这么多块的敌方坦克以低精度模拟，默认全部完整精度")
+    parser.add_argument("--ai-max-decisions", type=int, help="每个tick最多做决定的敌方坦克数，默认不限制")
+    parser.add_argument("--ai-lod-ticks", type=int, default=0, help="远处的敌方坦克每远一块，做决定的间隔多这么多tick")
+    parser.add_argument("--output", default="benchmark.json", help="结果文件路径")
+    parser.add_argument("--compare", metavar="BASELINE", help="和这个结果文件比较，变慢超过阈值时退出码为1")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许变慢的比例")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory, \
+            ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for size in args.sizes:
+            for enemies in args.enemies:
+                # the generator fills the top rows first, leave room for the walls and the base
+                if enemies > (size - 2) * (size - 2) * (1 - args.density) // 2:
+                    print("skip {}x{} with {} enemies, not enough room".format(size, size, enemies))
+                    continue
+                result = executor.submit(runCase, directory, size, args.density, enemies, args.ticks, args.seed,
+                                         args.lod_radius, args.ai_max_decisions, args.ai_lod_ticks).result()
+                results.append(result)
+                print("{}x{} with {} enemies: {:.0f} us/tick".format(size, size, enemies, result["tickUs"]))
+
+    with open(args.output, "w") as f:
+        json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                   "time": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, indent=1)
+    printTable(results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for result, metric, before, after in regressions:
+            print("REGRESSION {}x{} with {} enemies: {} {:.1f} -> {:.1f} (+{:.0%})".format(
+                result["size"], result["size"], result["enemies"], metric, before, after, after / before - 1))
+        if regressions:
+            sys.exit(1)
+        print("no regressions against {}".format(args.compare))
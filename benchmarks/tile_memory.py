@@ -0,0 +1,99 @@
+"""
+比较静态地形的两种存储方式在一张生成的大地图上占用的内存。
+
+精灵：每个砖墙/金属墙格子一个Wall/MetalWall精灵，放进精灵组里（图块层之前的做法）。
+图块：占用网格上的类型码和血量数组，加上每种地形一份共享的TileType。
+
+Python堆上的内存用tracemalloc统计（NumPy数组也会被统计到）。在图片缓存之前，每个精灵还各自持有一张缩放后的Surface，
+这部分像素数据不在Python堆上，单独按Surface的字节数估算。
+
+用法：python -m benchmarks.tile_memory [--size 200] [--density 0.35]
+"""
+import gc
+import random
+import tracemalloc
+from types import SimpleNamespace
+
+import pygame
+from Assets import assets
+from Items import Wall, MetalWall
+from Occupancy import OccupancyGrid
+from Tiles import TileLayer
+
+
+def generateTerrain(size: int, density: float, seed=0):
+    """
+    生成一张四周是金属墙、内部随机分布砖墙和少量金属墙的地形
+
+    :return: (x, y, 种类)的列表
+    """
+    rng = random.Random(seed)
+    cells = []
+    for y in range(size):
+        for x in range(size):
+            if x in (0, size - 1) or y in (0, size - 1):
+                cells.append((x, y, "MetalWall"))
+            elif rng.random() < density:
+                cells.append((x, y, "Wall" if rng.random() < 0.8 else "MetalWall"))
+    return cells
+
+
+def measure(build):
+    """
+    :param build: 构建数据结构的函数
+    :return: (构建结果, 占用的Python堆字节数)
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def buildSprites(cells):
+    groups = {"Wall": pygame.sprite.Group(), "MetalWall": pygame.sprite.Group()}
+    for x, y, kind in cells:
+        if kind == "Wall":
+            groups[kind].add(Wall(120, 5, (x * 50, y * 50), 0))
+        else:
+            groups[kind].add(MetalWall(-1, 1, (x * 50, y * 50), 0))
+    return groups
+
+
+def buildTiles(cells, size: int):
+    gameMap = SimpleNamespace(occupancy=OccupancyGrid(size, size))
+    layer = TileLayer(gameMap)
+    layer.addType("Wall", 120, 5)
+    layer.addType("MetalWall", -1, 1)
+    for x, y, kind in cells:
+        layer.setTile(x, y, kind)
+    return layer
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="比较精灵和图块两种地形存储方式的内存占用")
+    parser.add_argument("--size", type=int, default=200, help="地图边长（格子数）")
+    parser.add_argument("--density", type=float, default=0.35, help="内部格子是墙的概率")
+    args = parser.parse_args()
+
+    cells = generateTerrain(args.size, args.density)
+    # load the shared images outside of the measurement
+    assets.get("images/Wall.png")
+    assets.get("images/MetalWall.png")
+    sprites, spriteBytes = measure(lambda: buildSprites(cells))
+    tiles, tileBytes = measure(lambda: buildTiles(cells, args.size))
+    sample = pygame.transform.scale(pygame.image.load("images/Wall.png"), (50, 50))
+    # every sprite owned a scaled Surface before the asset cache
+    pixelBytes = sample.get_bytesize() * sample.get_width() * sample.get_height() * len(cells)
+
+    print("{}x{} map, {} wall tiles".format(args.size, args.size, len(cells)))
+    print("{:<34}{:>14}{:>14}".format("representation", "bytes", "bytes/tile"))
+    for name, size in (("sprites (shared surfaces)", spriteBytes),
+                       ("sprites (own surfaces, estimated)", spriteBytes + pixelBytes),
+                       ("tile layer", tileBytes)):
+        print("{:<34}{:>14,}{:>14.1f}".format(name, size, size / len(cells)))
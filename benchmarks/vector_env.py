@@ -0,0 +1,42 @@
+"""
+批量环境的吞吐量测试：K局游戏用随机动作同步推进，测量每秒推进的总步数（K * 步数）、观测耗时的占比和结束的局数。
+
+用法：python -m benchmarks.vector_env [--counts 1 8 32] [--steps 500] [地图]
+"""
+import time
+
+import numpy as np
+
+from VectorEnv import VectorEnv, ACTIONS
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="批量环境的吞吐量测试")
+    parser.add_argument("map", nargs="?", default="level1.map", help="地图路径")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 8, 32], help="局数K")
+    parser.add_argument("--steps", type=int, default=500, help="推进的步数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args()
+
+    print("{:>6}{:>14}{:>14}{:>12}".format("K", "env steps/s", "observe %", "episodes"))
+    for count in args.counts:
+        env = VectorEnv(args.map, count=count, seed=args.seed, tickLimit=1800)
+        env.reset()
+        rng = np.random.default_rng(args.seed)
+        observeTime = 0.0
+        observe = env.observe
+
+        def timedObserve(k):
+            global observeTime
+            start = time.perf_counter()
+            observe(k)
+            observeTime += time.perf_counter() - start
+
+        env.observe = timedObserve
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            env.step(rng.integers(0, len(ACTIONS), count))
+        elapsed = time.perf_counter() - start
+        print("{:>6}{:>14.0f}{:>14.1f}{:>12}".format(count, count * args.steps / elapsed,
+                                                      observeTime / elapsed * 100, env.episodes))
@@ -1,102 +1,257 @@
-import random
-
 import pygame
-from GameMap import GameMap
+from Engine import Simulation, WIN, LOSE
+from Assets import assets
+from Renderer import Renderer
+from Camera import Camera, VIEWPORT
+from Events import events, VERBOSITY_NAMES
+from Profiler import profiler, HudOverlay
+from MapLoader import indexLevels
+import Snapshot
+from concurrent.futures import ThreadPoolExecutor
+import atexit
 import os
-import re
+import time
+
+
+# 方向键和空格对应的玩家动作
+KEY_ACTIONS = {
+    pygame.K_UP: "UP",
+    pygame.K_DOWN: "DOWN",
+    pygame.K_LEFT: "LEFT",
+    pygame.K_RIGHT: "RIGHT",
+    pygame.K_SPACE: "FIRE",
+}
+# 显示/隐藏性能信息浮层的按键
+HUD_KEY = pygame.K_F3
+# 快速存档和读档的按键，以及存档文件
+QUICKSAVE_KEY = pygame.K_F5
+QUICKLOAD_KEY = pygame.K_F9
+QUICKSAVE_PATH = "quicksave.snap"
+# 离玩家超过这么多块的敌方坦克以低精度模拟
+LOD_RADIUS = 2
+# 每个tick最多做决定的敌方坦克数和AI的时间预算（毫秒），远处的敌方坦克每远一块做决定的间隔多几个tick
+AI_MAX_DECISIONS = 32
+AI_BUDGET_MS = 2.0
+AI_LOD_TICKS = 4
+
+
+def createSimulation(map: str):
+    """
+    按窗口模式的设置创建一局游戏，不碰窗口，可以在后台线程里调用
+
+    :param map: 游戏地图的路径
+    :return: Simulation对象
+    """
+    return Simulation(map, lodRadius=LOD_RADIUS, aiMaxDecisions=AI_MAX_DECISIONS, aiLodTicks=AI_LOD_TICKS)
+
+
+class LevelPrefetcher:
+    """
+    在一个后台线程里提前创建下一关的Simulation（解析地图、加载图片、创建精灵），切换关卡时直接拿来用。
+    记录最近一次取关卡时加载用了多久，以及主线程等了多久
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # map path -> Future of (simulation, seconds spent creating it)
+        self.pending = {}
+        self.loadTime = 0.0
+        self.waitTime = 0.0
+
+    def prefetch(self, map: str):
+        """
+        开始在后台创建一关
+
+        :param map: 游戏地图的路径
+        """
+        if map not in self.pending:
+            self.pending[map] = self.executor.submit(timed, createSimulation, map)
 
+    def take(self, map: str):
+        """
+        取出一关，还没开始预取就在当前线程里创建，还没创建完就等它
 
-def gameLoop(map: str):
+        :param map: 游戏地图的路径
+        :return: Simulation对象
+        """
+        start = time.perf_counter()
+        future = self.pending.pop(map, None)
+        if future is None:
+            simulation, self.loadTime = timed(createSimulation, map)
+        else:
+            simulation, self.loadTime = future.result()
+        self.waitTime = time.perf_counter() - start
+        return simulation
+
+
+def timed(function, *args):
+    """
+    :return: (function(*args)的返回值, 用了多少秒)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def gameLoop(map: str, replayPath=None, simulation=None, startedAt=None):
     """
-    一局的游戏循环函数，负责进行游戏的碰撞检测、绘图、事件处理等。
+    一局的游戏循环函数，负责绘图和事件处理，碰撞检测、AI等由Simulation按固定步长推进。
+    窗口最大为VIEWPORT，摄像机跟随玩家坦克，远处的敌方坦克以低精度模拟。
+    敌方坦克的AI按预算分摊到各个tick，录像时不使用按真实时间计算的预算，保证录像可以重放。
+    按F3显示或隐藏性能信息浮层，显示浮层时会打开分阶段计时器。按F5把当前这一局存进QUICKSAVE_PATH，按F9读回来，录像时不能读档。
 
     :param map: 游戏地图的路径
+    :param replayPath: 录像的保存路径，None为不录制
+    :param simulation: 提前创建好的Simulation对象，None为现在创建
+    :param startedAt: 开始准备这一关的time.perf_counter()，给出时画完第一帧后输出准备这一关一共用了多久
     """
     fpsClock = pygame.time.Clock()
     pygame.display.set_caption("坦克大战 - {}".format(os.path.splitext(map)[0]))
-    m = GameMap(map)
-    screen = pygame.display.set_mode((m.width, m.height), 0, 32)
-    for j in m.realMap:
-        for i in j:
-            if i:
-                i.setGameMap(m)
-    myTank = m.groups["FriendlyTank"].sprites()[0]
-    index = 0
+    if simulation is None:
+        simulation = createSimulation(map)
+    if replayPath is not None:
+        simulation.startRecording()
+    else:
+        simulation.ai.budgetMs = AI_BUDGET_MS
+    m = simulation.map
+    camera = Camera(m, VIEWPORT)
+    screen = pygame.display.set_mode(camera.size, 0, 32)
+    assets.convertAll()
+    m.refreshImages()
+    print(assets.report())
+    renderer = Renderer(m, screen, camera)
     pygame.time.set_timer(pygame.USEREVENT, 1000)
+    # profiling that was turned on from the command line stays on when the overlay is hidden
+    profiling = profiler.enabled
+    hud = None
     while True:
-        screen.fill((0, 0, 0))
+        if profiler.enabled:
+            profiler.startFrame()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                saveReplay(simulation, replayPath)
                 quit(0)
+            elif event.type == pygame.KEYDOWN and event.key == HUD_KEY:
+                if hud is None:
+                    hud = HudOverlay(profiler)
+                    profiler.enable()
+                else:
+                    hud = None
+                    renderer.overlay = None
+                    if not profiling:
+                        profiler.disable()
+            elif event.type == pygame.KEYDOWN and event.key == QUICKSAVE_KEY:
+                Snapshot.save(simulation, QUICKSAVE_PATH)
+                print("Saved to {}.".format(QUICKSAVE_PATH))
+            elif event.type == pygame.KEYDOWN and event.key == QUICKLOAD_KEY:
+                if replayPath is not None:
+                    print("Cannot load while recording a replay.")
+                elif os.path.exists(QUICKSAVE_PATH):
+                    try:
+                        Snapshot.load(simulation, QUICKSAVE_PATH)
+                        renderer.fullRedraw = True
+                    except Snapshot.SnapshotError as e:
+                        print("Cannot load {}: {}".format(QUICKSAVE_PATH, e))
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
-                    myTank.move("UP", myTank.speed, 50)  # 10 speed, 50 pixels
-                elif event.key == pygame.K_DOWN:
-                    myTank.move("DOWN", myTank.speed, 50)
-                elif event.key == pygame.K_LEFT:
-                    myTank.move("LEFT", myTank.speed, 50)
-                elif event.key == pygame.K_RIGHT:
-                    myTank.move("RIGHT", myTank.speed, 50)
-                elif event.key == pygame.K_SPACE:
-                    myTank.fire(m)
+                simulation.applyAction(KEY_ACTIONS.get(event.key))
             elif event.type == pygame.USEREVENT:
-                if index < len(m.groups["InvisibleEnemyTank"]):
-                    m.groups["InvisibleEnemyTank"].sprites()[index].invisible = False
-                    m.groups["EnemyTank"].add(m.groups["InvisibleEnemyTank"].sprites()[index])
-                    index += 1
-
-        for tank in m.groups["EnemyTank"]:
-            if not tank.moving:
-                tank.fire(m)
-                tank.move(tank.searchPath(myTank), tank.speed, 50)
-
-        for key in m.groups.keys():
-            # Only check the objects that can move
-            if key == "EnemyTank" or key == "FriendlyTank" or key == "Missal":
-                for tank in m.groups[key]:
-                    for targetGroup in m.groups.keys():
-                        for item in m.groups[targetGroup]:
-                            # avoid check myself
-                            if item is tank:
-                                continue
-                            if pygame.sprite.collide_mask(item, tank):
-                                tank.attack(item)
-            if key != "InvisibleEnemyTank":
-                m.groups[key].draw(screen)
-
-        if myTank.hp == 0 or len(m.groups["Base"]) == 0:
+                simulation.spawnNext()
+        if profiler.enabled:
+            profiler.lap("events")
+
+        if hud is not None:
+            renderer.overlay = hud.render()
+        camera.follow(simulation.player)
+        renderer.draw()
+        if startedAt is not None:
+            print("Level {} ready in {:.1f} ms.".format(map, (time.perf_counter() - startedAt) * 1000))
+            startedAt = None
+
+        if simulation.outcome == LOSE:
             print("Game Over!")
             pygame.display.set_caption("Game Over!")
             while True:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
+                        saveReplay(simulation, replayPath)
                         quit(0)
                     elif event.type == pygame.KEYDOWN:
+                        saveReplay(simulation, replayPath)
                         return
-        elif len(m.groups["InvisibleEnemyTank"]) == 0:
+        elif simulation.outcome == WIN:
             print("You Win!")
             pygame.display.set_caption("You Win!")
             while True:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
+                        saveReplay(simulation, replayPath)
                         quit(0)
                     elif event.type == pygame.KEYDOWN:
+                        saveReplay(simulation, replayPath)
                         return
 
-        pygame.display.update()
-        fpsClock.tick(60)  # 60 fps means this loop 60 times per 1s
+        # 60 fps means this loop 60 times per 1s, the simulation runs 60 ticks per 1s no matter the frame rate
+        elapsed = fpsClock.tick(60)
+        if profiler.enabled:
+            profiler.lap("idle")
+        ticks = simulation.advance(elapsed)
+        if profiler.enabled:
+            counts = {key: len(group) for key, group in m.groups.items()}
+            counts["Missile"] = len(m.missiles)
+            counts["AIQueue"] = simulation.ai.queueLength
+            counts["AIOverruns"] = simulation.ai.overruns
+            counts["PairsTested"] = m.spatialHash.lastPairsTested
+            profiler.endFrame(ticks, counts)
+
+
+def saveReplay(simulation: Simulation, replayPath):
+    """
+    一局结束或者退出时保存录像
+
+    :param simulation: Simulation对象
+    :param replayPath: 录像的保存路径，None为不录制
+    """
+    if replayPath is not None:
+        simulation.replay.save(replayPath)
+        print("Replay saved to {}, {} ticks.".format(replayPath, simulation.replay.ticks))
 
 
 if __name__ == '__main__':
-    pygame.init()
-    maps = []
-    for root, dirs, files in os.walk("./"):
-        for file in files:
-            if os.path.splitext(file)[1] == '.map':
-                maps.append(file)
+    import argparse
 
-    maps = sorted(maps)
+    parser = argparse.ArgumentParser(description="坦克大战")
+    parser.add_argument("--log", help="事件日志的路径，\"-\"为以文字形式输出到控制台，不给出时不记录事件")
+    parser.add_argument("--verbosity", choices=VERBOSITY_NAMES, default="combat", help="记录哪些事件")
+    parser.add_argument("--record", metavar="DIR", help="把每一局的录像保存到这个目录，用python Replay.py重放")
+    parser.add_argument("--profile", metavar="PATH", help="打开分阶段计时器，退出时把每一帧的计时导出到CSV或JSON文件")
+    args = parser.parse_args()
+    if args.profile is not None:
+        profiler.enable()
+        profiler.keepFrames = True
+        atexit.register(profiler.export, args.profile)
+    if args.record is not None:
+        os.makedirs(args.record, exist_ok=True)
+    if args.log is not None:
+        events.configure(VERBOSITY_NAMES.index(args.verbosity), args.log)
+
+    # cold start is measured up to the first frame of the first level, level switches from the end of the last one
+    startedAt = time.perf_counter()
+    pygame.init()
+    levels, indexTime = timed(indexLevels)
+    print("Indexed {} levels in {:.1f} ms.".format(len(levels), indexTime * 1000))
 
-    for eachMap in maps:
-        gameLoop(eachMap)
+    prefetcher = LevelPrefetcher()
+    for i, level in enumerate(levels):
+        simulation = prefetcher.take(level.path)
+        print("Level {} ({}x{}) loaded in {:.1f} ms, waited {:.1f} ms.".format(
+            level.path, level.width, level.height, prefetcher.loadTime * 1000, prefetcher.waitTime * 1000))
+        # the next level is built while this one is played
+        if i + 1 < len(levels):
+            prefetcher.prefetch(levels[i + 1].path)
+        replayPath = None
+        if args.record is not None:
+            replayPath = os.path.join(args.record, "{}-{}.replay".format(os.path.splitext(level.path)[0],
+                                                                        time.strftime("%Y%m%d-%H%M%S")))
+        gameLoop(level.path, replayPath, simulation, startedAt)
         print("\n" * 10)
+        startedAt = time.perf_counter()